@@ -16,7 +16,6 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
-import asyncio
 import copy
 from datetime import datetime, timedelta, timezone
 import getopt
@@ -26,7 +25,6 @@ import os
 import pprint
 import sys
 import traceback
-from xml.dom import minidom
 import xml.etree.ElementTree as etree
 try:
     import jmespath
@@ -39,8 +37,14 @@ sys.path[:0] = [os.path.join(libpath, os.pardir)]
 
 
 from paniot import (IotApi, ArgsError, panos_device_objects,
+                    panos_device_objects_iter, panos_device_objects_aiter,
+                    panos_device_objects_diff, panos_device_objects_parallel,
+                    panos_xml_write,
                     DEBUG1, DEBUG2, DEBUG3,
                     DEFAULT_API_VERSION, __version__)
+from paniot import jsoncodec
+from paniot.httpcache import HttpCache
+from paniot.ratelimit import RateLimiter, FileRateLimiter
 
 INDENT = 4
 
@@ -65,6 +69,10 @@ def main():
         handler.setFormatter(formatter)
         logger.addHandler(handler)
 
+    if options['panos_input'] is not None:
+        panos_input(options)
+        return
+
     kwargs = {}
     for x in ['api-version', 'url',
               'customerid', 'access-key-id', 'access-key',
@@ -73,9 +81,34 @@ def main():
             k = x.replace('-', '_')
             kwargs[k] = options[x]
 
+    if options['rate_limit'] is True:
+        kwargs['rate_limiter'] = RateLimiter()
+    elif options['rate_limit']:
+        try:
+            kwargs['rate_limiter'] = FileRateLimiter(options['rate_limit'])
+        except ArgsError as e:
+            print('--rate-limit:', e, file=sys.stderr)
+            sys.exit(1)
+
+    if options['pool_size'] is not None:
+        kwargs['pool_size'] = options['pool_size']
+    if options['json_codec'] is not None:
+        kwargs['json_codec'] = options['json_codec']
+    if options['http_cache'] is not None:
+        try:
+            kwargs['http_cache'] = HttpCache(options['http_cache'],
+                                             ttl=options['http_cache_ttl'])
+        except ArgsError as e:
+            print('--http-cache:', e, file=sys.stderr)
+            sys.exit(1)
+
     try:
         if options['aio']:
-            asyncio.run(aioapi_request(kwargs, options))
+            import asyncio
+            if options['tenants']:
+                asyncio.run(aiotenants_request(kwargs, options))
+            else:
+                asyncio.run(aioapi_request(kwargs, options))
         else:
             api_request(kwargs, options)
     except KeyboardInterrupt:
@@ -111,6 +144,60 @@ async def aioapi_request(kwargs, options):
         print_exception(e, options['debug'])
 
 
+async def aiotenants_request(kwargs, options):
+    import paniot.multi
+
+    if options['devices']:
+        method = 'devices_all'
+        kwargs_ = {
+            'stime': options['stime'],
+            'detail': options['detail'],
+        }
+    elif options['vulns']:
+        method = 'vulnerabilities_all'
+        kwargs_ = {
+            'groupby': options['groupby'],
+            'stime': options['stime'],
+        }
+    elif options['alerts']:
+        method = 'alerts_all'
+        kwargs_ = {
+            'stime': options['stime'],
+        }
+    elif options['policies']:
+        method = 'policies_all'
+        kwargs_ = {}
+    kwargs_['query_string'] = options['query_string_obj']
+    kwargs_['incremental'] = options['incremental']
+    if options['concurrency'] is not None and method != 'vulnerabilities_all':
+        kwargs_['concurrency'] = options['concurrency']
+
+    # constructor arguments for each tenant; the tenant key files
+    # provide customerid and the access keys
+    api_kwargs = dict(kwargs)
+    for x in ['customerid', 'access_key_id', 'access_key']:
+        api_kwargs.pop(x, None)
+    if 'pool_size' in api_kwargs:
+        kwargs_['max_connections'] = api_kwargs.pop('pool_size')
+    if 'rate_limiter' in api_kwargs:
+        kwargs_['rate_limiter'] = api_kwargs.pop('rate_limiter')
+    elif options['rate_limit'] is False:
+        kwargs_['rate_limiter'] = None
+    kwargs_['api_kwargs'] = api_kwargs
+
+    try:
+        async for customerid, ok, x in paniot.multi.tenants_all(
+                options['tenants'], method=method, **kwargs_):
+            if not ok:
+                print_status('%s: %s' % (customerid, method), x)
+                await aioprint_response(options, x)
+                x.raise_for_status()
+            print_json_line(options, x, customerid=customerid)
+
+    except Exception as e:
+        print_exception(e, options['debug'])
+
+
 def request(api, options):
     if options['print_jwt']:
         print_jwt(api)
@@ -141,6 +228,8 @@ def request(api, options):
             'stime': options['stime'],
             'detail': options['detail'],
             'query_string': options['query_string_obj'],
+            'concurrency': options['concurrency'],
+            'incremental': options['incremental'],
         }
 
         wrap_obj(options, api.devices_all, **kwargs)
@@ -173,6 +262,7 @@ def request(api, options):
             'groupby': options['groupby'],
             'stime': options['stime'],
             'query_string': options['query_string_obj'],
+            'incremental': options['incremental'],
         }
 
         wrap_obj(options, api.vulnerabilities_all, **kwargs)
@@ -191,6 +281,8 @@ def request(api, options):
         kwargs = {
             'stime': options['stime'],
             'query_string': options['query_string_obj'],
+            'concurrency': options['concurrency'],
+            'incremental': options['incremental'],
         }
 
         wrap_obj(options, api.alerts_all, **kwargs)
@@ -223,6 +315,8 @@ def request(api, options):
     elif options['policies']:
         kwargs = {
             'query_string': options['query_string_obj'],
+            'concurrency': options['concurrency'],
+            'incremental': options['incremental'],
         }
 
         wrap_obj(options, api.policies_all, **kwargs)
@@ -283,6 +377,8 @@ async def aiorequest(api, options):
             'stime': options['stime'],
             'detail': options['detail'],
             'query_string': options['query_string_obj'],
+            'concurrency': options['concurrency'],
+            'incremental': options['incremental'],
         }
 
         await aiowrap_obj(options, api.devices_all, **kwargs)
@@ -315,6 +411,7 @@ async def aiorequest(api, options):
             'groupby': options['groupby'],
             'stime': options['stime'],
             'query_string': options['query_string_obj'],
+            'incremental': options['incremental'],
         }
 
         await aiowrap_obj(options, api.vulnerabilities_all, **kwargs)
@@ -333,6 +430,8 @@ async def aiorequest(api, options):
         kwargs = {
             'stime': options['stime'],
             'query_string': options['query_string_obj'],
+            'concurrency': options['concurrency'],
+            'incremental': options['incremental'],
         }
 
         await aiowrap_obj(options, api.alerts_all, **kwargs)
@@ -365,6 +464,8 @@ async def aiorequest(api, options):
     elif options['policies']:
         kwargs = {
             'query_string': options['query_string_obj'],
+            'concurrency': options['concurrency'],
+            'incremental': options['incremental'],
         }
 
         await aiowrap_obj(options, api.policies_all, **kwargs)
@@ -413,6 +514,58 @@ class GeneratorList(list):
         return 1
 
 
+def get_all(options, func, **kwargs):
+    for ok, x in func(**kwargs):
+        if not ok:
+            print_status(func.__name__, x)
+            print_response(options, x)
+            x.raise_for_status()
+        yield x
+
+
+async def aioget_all(options, func, **kwargs):
+    async for ok, x in func(**kwargs):
+        if not ok:
+            print_status(func.__name__, x)
+            await aioprint_response(options, x)
+            x.raise_for_status()
+        yield x
+
+
+class PanosWriter:
+    # Print PAN-OS Device-ID objects from panos_device_objects_iter()
+    # as they are converted.
+    def __init__(self, format, chunk_size=None):
+        self.root = None
+        if format == 'xml':
+            self.root = 'device-object'
+        elif format in ['xml2', 'xml3'] and chunk_size is None:
+            self.root = 'multi-config'
+        self.started = False
+
+    def write(self, device):
+        if isinstance(device, str):
+            print(device)
+            return
+        if self.root is None:
+            # multi-config document
+            panos_xml_write(device)
+            return
+
+        if not self.started:
+            print('<%s>' % self.root)
+            self.started = True
+        panos_xml_write(device, level=1)
+
+    def close(self):
+        if self.root is None:
+            return
+        if self.started:
+            print('</%s>' % self.root)
+        else:
+            print('<%s/>' % self.root)
+
+
 def wrap_obj(options, func, **kwargs):
     if options['opt_json']:
         # only allowed with noaio
@@ -422,12 +575,25 @@ def wrap_obj(options, func, **kwargs):
 
         return
 
+    if options['stream'] and options['panos'] and options['devices']:
+        devices = panos_device_objects_iter(
+            data=get_all(options, func, **kwargs),
+            format=options['panos'],
+            filter=options['panos_filter_obj'],
+            dedup=options['dedup'],
+            chunk_size=options['panos_chunk'])
+        writer = PanosWriter(options['panos'], options['panos_chunk'])
+        for device in devices:
+            writer.write(device)
+        writer.close()
+
+        return
+
     obj = {
         'things': []
     }
 
-    wrap = True
-    # XXX default to False with option to enable?
+    wrap = not options['stream']
     for ok, x in func(**kwargs):
         if not ok:
             print_status(func.__name__, x)
@@ -436,18 +602,31 @@ def wrap_obj(options, func, **kwargs):
         elif wrap:
             obj['things'].append(x)
         else:
-            print_json_response(options, x)
+            print_json_line(options, x)
     if wrap:
         print_json_response(options, obj)
 
 
 async def aiowrap_obj(options, func, **kwargs):
+    if options['stream'] and options['panos'] and options['devices']:
+        devices = panos_device_objects_aiter(
+            data=aioget_all(options, func, **kwargs),
+            format=options['panos'],
+            filter=options['panos_filter_obj'],
+            dedup=options['dedup'],
+            chunk_size=options['panos_chunk'])
+        writer = PanosWriter(options['panos'], options['panos_chunk'])
+        async for device in devices:
+            writer.write(device)
+        writer.close()
+
+        return
+
     obj = {
         'things': []
     }
 
-    wrap = True
-    # XXX default to False with option to enable?
+    wrap = not options['stream']
     async for ok, x in func(**kwargs):
         if not ok:
             print_status(func.__name__, x)
@@ -456,7 +635,7 @@ async def aiowrap_obj(options, func, **kwargs):
         elif wrap:
             obj['things'].append(x)
         else:
-            print_json_response(options, x)
+            print_json_line(options, x)
     if wrap:
         print_json_response(options, obj)
 
@@ -507,14 +686,127 @@ async def aioprint_response(options, resp):
         print(await resp.text())
 
 
+def search_jmespath(options, x):
+    if options['jmespath'] is None:
+        return x
+
+    try:
+        return jmespath.search(options['jmespath'], x)
+    except jmespath.exceptions.JMESPathError as e:
+        print('JMESPath %s: %s' % (e.__class__.__name__, e),
+              file=sys.stderr)
+        sys.exit(1)
+
+
+def print_json_line(options, x, customerid=None):
+    # newline delimited JSON, one object per line
+    x = search_jmespath(options, x)
+    if customerid is not None:
+        x = {'customerid': customerid, 'thing': x}
+    print(options['json_codec_obj'].dumps(x, sort_keys=True))
+
+
+def load_panos_state(path):
+    # Device-ID object names from the previous --panos-state run
+    try:
+        with open(path, 'r') as f:
+            x = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (IOError, ValueError) as e:
+        print('--panos-state %s: %s' % (path, e), file=sys.stderr)
+        sys.exit(1)
+
+    if not isinstance(x, dict) or not isinstance(x.get('names'), list):
+        print('--panos-state %s: invalid state file' % path,
+              file=sys.stderr)
+        sys.exit(1)
+
+    return x['names']
+
+
+def save_panos_state(path, names):
+    # replace atomically so an interrupted run keeps the old state
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump({'names': sorted(names)}, f, indent=INDENT)
+            f.write('\n')
+        os.replace(tmp, path)
+    except IOError as e:
+        print('--panos-state %s: %s' % (path, e), file=sys.stderr)
+        sys.exit(1)
+
+
+def print_panos(options, data):
+    if options['panos_state'] is not None:
+        names = load_panos_state(options['panos_state'])
+        devices, names = panos_device_objects_diff(
+            data=data,
+            names=names,
+            filter=options['panos_filter_obj'],
+            dedup=options['dedup'])
+        for device in devices:
+            print(device)
+        save_panos_state(options['panos_state'], names)
+        return
+
+    kwargs = {
+        'format': options['panos'],
+        'filter': options['panos_filter_obj'],
+        'dedup': options['dedup'],
+        'chunk_size': options['panos_chunk'],
+    }
+    if options['processes'] is not None:
+        devices = panos_device_objects_parallel(
+            data=data,
+            processes=options['processes'],
+            **kwargs)
+    else:
+        if not isinstance(data, list):
+            data = list(data)
+        devices = panos_device_objects(data=data, **kwargs)
+
+    for device in devices:
+        if isinstance(device, str):
+            print(device)
+        elif isinstance(device, etree.Element):
+            panos_xml_write(device)
+        else:
+            assert False, 'unknown type: %s' % type(device)
+
+
+def panos_input(options):
+    # convert newline delimited JSON devices, for example from
+    # --devices --stream
+    path = options['panos_input']
+
+    def devices(f):
+        for i, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                print('--panos-input %s:%d: %s' % (path, i, e),
+                      file=sys.stderr)
+                sys.exit(1)
+
+    try:
+        if path == '-':
+            print_panos(options, devices(sys.stdin))
+        else:
+            with open(path, 'r') as f:
+                print_panos(options, devices(f))
+    except IOError as e:
+        print('--panos-input %s: %s' % (path, e), file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print_exception(e, options['debug'])
+
+
 def print_json_response(options, x):
-    if options['jmespath'] is not None:
-        try:
-            x = jmespath.search(options['jmespath'], x)
-        except jmespath.exceptions.JMESPathError as e:
-            print('JMESPath %s: %s' % (e.__class__.__name__, e),
-                  file=sys.stderr)
-            sys.exit(1)
+    x = search_jmespath(options, x)
 
     if options['panos'] and (options['device'] or
                              options['devices'] or
@@ -533,25 +825,9 @@ def print_json_response(options, x):
         else:
             assert False, 'unknown type: %s' % type(x)
 
-        devices = panos_device_objects(
-            data=x,
-            format=options['panos'],
-            filter=options['panos_filter_obj'],
-            dedup=options['dedup'])
-        for device in devices:
-            if isinstance(device, str):
-                print(device)
-            elif isinstance(device, etree.Element):
-                document = etree.tostring(device, encoding='UTF-8')
-                dom = minidom.parseString(document.decode('UTF-8'))
-                document = dom.toprettyxml(indent=' ' * 2)  # PAN-OS indent
-                if document.startswith('<?xml version="1.0" ?>\n'):
-                    start = document.find('\n') + 1
-                    print(document[start:], end='')
-                else:
-                    print(document, end='')
-            else:
-                assert False, 'unknown type: %s' % type(device)
+        print_panos(options, x)
+        if options['panos_state'] is not None:
+            return
 
     if options['print_python']:
         print(pprint.pformat(x))
@@ -653,6 +929,7 @@ def parse_opts():
 
     options = {
         'config': {},
+        'tenants': [],
         'api-version': None,
         'url': None,
         'access-key-id': None,
@@ -689,12 +966,24 @@ def parse_opts():
         'print_python': False,
         'jmespath': None,
         'opt_json': False,
+        'stream': False,
+        'incremental': False,
+        'json_codec': None,
         'panos': None,
+        'panos_chunk': None,
+        'panos_state': None,
+        'panos_input': None,
+        'processes': None,
         'panos_filter': None,
         'panos_filter_obj': None,
         'dedup': True,
         'print_jwt': False,
         'timeout': None,
+        'rate_limit': None,
+        'concurrency': None,
+        'pool_size': None,
+        'http_cache': None,
+        'http_cache_ttl': 3600,
         'debug': 0,
         'dtime': False,
     }
@@ -713,8 +1002,13 @@ def parse_opts():
         'device-update', 'vuln-update', 'alert-update',
         'id=',
         'verify=', 'aio', 'noaio',
-        'panos=', 'panos-filter=', 'dedup', 'nodedup',
-        'jwt', 'timeout=',
+        'panos=', 'panos-filter=', 'panos-chunk=', 'panos-state=',
+        'panos-input=', 'processes=',
+        'dedup', 'nodedup',
+        'jwt', 'timeout=', 'rate-limit=', 'stream', 'json-codec=',
+        'incremental',
+        'tenant=', 'concurrency=', 'pool-size=',
+        'http-cache=', 'http-cache-ttl=',
     ]
 
     try:
@@ -802,6 +1096,34 @@ def parse_opts():
                 sys.exit(1)
             if len(options['timeout']) == 1:
                 options['timeout'] = options['timeout'][0]
+        elif opt == '--tenant':
+            options['tenants'].append(arg)
+        elif opt in ['--concurrency', '--pool-size']:
+            try:
+                x = int(arg)
+                if x < 1:
+                    raise ValueError
+            except ValueError:
+                print('Invalid %s: %s' % (opt, arg), file=sys.stderr)
+                sys.exit(1)
+            options[opt[2:].replace('-', '_')] = x
+        elif opt == '--http-cache':
+            options['http_cache'] = arg
+        elif opt == '--http-cache-ttl':
+            try:
+                options['http_cache_ttl'] = float(arg)
+                if options['http_cache_ttl'] < 0:
+                    raise ValueError
+            except ValueError:
+                print('Invalid --http-cache-ttl:', arg, file=sys.stderr)
+                sys.exit(1)
+        elif opt == '--rate-limit':
+            if arg == 'yes':
+                options['rate_limit'] = True
+            elif arg == 'no':
+                options['rate_limit'] = False
+            else:
+                options['rate_limit'] = arg
         elif opt == '--aio':
             options['aio'] = True
         elif opt == '--noaio':
@@ -812,6 +1134,26 @@ def parse_opts():
             options['print_python'] = True
         elif opt == '--panos':
             options['panos'] = arg
+        elif opt == '--panos-chunk':
+            try:
+                options['panos_chunk'] = int(arg)
+                if options['panos_chunk'] < 1:
+                    raise ValueError
+            except ValueError:
+                print('Invalid --panos-chunk:', arg, file=sys.stderr)
+                sys.exit(1)
+        elif opt == '--panos-input':
+            options['panos_input'] = arg
+        elif opt == '--processes':
+            try:
+                options['processes'] = int(arg)
+                if options['processes'] < 1:
+                    raise ValueError
+            except ValueError:
+                print('Invalid --processes:', arg, file=sys.stderr)
+                sys.exit(1)
+        elif opt == '--panos-state':
+            options['panos_state'] = arg
         elif opt == '--panos-filter':
             options['panos_filter'] = process_arg(arg)
         elif opt == '--dedup':
@@ -826,6 +1168,12 @@ def parse_opts():
             options['jmespath'] = arg
         elif opt == '-O':
             options['opt_json'] = True
+        elif opt == '--stream':
+            options['stream'] = True
+        elif opt == '--incremental':
+            options['incremental'] = True
+        elif opt == '--json-codec':
+            options['json_codec'] = arg
         elif opt == '--jwt':
             options['print_jwt'] = True
         elif opt == '--debug':
@@ -854,6 +1202,31 @@ def parse_opts():
         print('Must use --noaio with -O', file=sys.stderr)
         sys.exit(0)
 
+    try:
+        options['json_codec_obj'] = jsoncodec.codec(options['json_codec'])
+    except ArgsError as e:
+        print('--json-codec:', e, file=sys.stderr)
+        sys.exit(1)
+
+    if options['incremental'] and options['concurrency'] is not None:
+        print('--incremental and --concurrency cannot be used together',
+              file=sys.stderr)
+        sys.exit(1)
+
+    if options['stream'] and options['opt_json']:
+        print('--stream and -O cannot be used together', file=sys.stderr)
+        sys.exit(1)
+
+    if options['tenants']:
+        if not options['aio']:
+            print('Must use --aio with --tenant', file=sys.stderr)
+            sys.exit(1)
+        if not (options['devices'] or options['vulns'] or
+                options['alerts'] or options['policies']):
+            print('--tenant requires --devices, --vulns, --alerts '
+                  'or --policies', file=sys.stderr)
+            sys.exit(1)
+
     for x in ['api-version', 'url',
               'access-key-id', 'access-key', 'customerid']:
         if x in options['config'] and options[x] is None:
@@ -869,9 +1242,34 @@ def parse_opts():
     if options['query_strings']:
         options['query_string_obj'] = process_json(options['query_strings'])
 
-    if (options['panos'] is not None and not options['debug'] and
-       options['panos'] not in ['xml', 'set']):
-        print('--panos must be xml or set', file=sys.stderr)
+    if (options['panos'] is not None and
+       options['panos'] not in ['xml', 'xml2', 'xml3', 'set']):
+        print('--panos must be xml, xml2, xml3 or set', file=sys.stderr)
+        sys.exit(1)
+
+    if options['panos_input'] is not None and options['panos'] is None:
+        print('--panos-input requires --panos', file=sys.stderr)
+        sys.exit(1)
+
+    if options['panos_state'] is not None:
+        if options['panos'] != 'set':
+            print('--panos-state requires --panos set', file=sys.stderr)
+            sys.exit(1)
+        # the state is the full device list; a partial list would
+        # delete the other devices
+        if not (options['devices'] or options['panos_input'] is not None):
+            print('--panos-state requires --devices or --panos-input',
+                  file=sys.stderr)
+            sys.exit(1)
+        if options['stream']:
+            print('--panos-state and --stream cannot be used together',
+                  file=sys.stderr)
+            sys.exit(1)
+
+    if (options['panos_chunk'] is not None and
+       options['panos'] not in ['xml2', 'xml3']):
+        print('--panos-chunk requires --panos xml2 or xml3',
+              file=sys.stderr)
         sys.exit(1)
 
     if options['panos_filter'] is not None:
@@ -935,12 +1333,27 @@ def usage():
     -p                       print Python
     -J expression            JMESPath expression for JSON response data
     -O                       optimized get all with JSON only output
-    --panos set|xml          convert IoT objects to PAN-OS Device-ID objects
+    --stream                 get all with newline delimited JSON output
+    --incremental            get all parsing items as responses are read
+    --json-codec name        JSON codec: orjson|ujson|json
+    --panos set|xml|xml2|xml3
+                             convert IoT objects to PAN-OS Device-ID objects
     --panos-filter json      fields to use in PAN-OS Device-ID object
+    --panos-chunk num        Device-ID objects per xml2/xml3 document
+    --panos-state path       output changes since last run using state file
+    --panos-input path       convert devices from newline delimited JSON file
+    --processes num          convert PAN-OS Device-ID objects in processes
     --dedup                  deduplicate PAN-OS Device-ID objects (default)
     --nodedup                do not deduplicate PAN-OS Device-ID objects
     --jwt                    print header, payload from JWT (access key)
     --timeout timeout        connect, read timeout
+    --rate-limit opt         client rate limit option: yes|no|path
+    --concurrency num        get all page requests in flight
+    --pool-size num          HTTP connection pool size
+    --http-cache path        cache tag, profile and policy responses in path
+    --http-cache-ttl sec     HTTP cache time to live (default 3600)
+    --tenant path            tenant key file for get all requests
+                             (multiple --tenant's allowed)
     -F path                  JSON options (multiple -F's allowed)
     --debug level            debug level (0-3)
     --dtime                  add time string to debug output
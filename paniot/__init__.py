@@ -14,10 +14,11 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
-import asyncio
 from collections import namedtuple
+from functools import lru_cache
 from hashlib import blake2b
 import logging
+import os
 import re
 import sys
 import xml.etree.ElementTree as etree
@@ -43,25 +44,53 @@ class ArgsError(ApiError):
     pass
 
 
-def panos_device_objects(*,
-                         data=None,
-                         format=None,
-                         filter=None,
-                         min_confidence=50,
-                         dedup=True):
-    def _name(x):
-        data = str(sorted(x.items()))
-        h = blake2b(data.encode(),
-                    digest_size=15)
-        return h.hexdigest()
+# A page from the *_pages() methods; elapsed is the seconds to
+# request and decode the page.
+Page = namedtuple('Page', ['items', 'offset', 'total', 'elapsed'])
 
-    def normalize(x):
-        # PAN-OS device dictionary does not allow & in fields and
-        # normalizes to ' and '.
-        for s in [' & ', ' &', '& ', '&']:
-            x = x.replace(s, ' and ')
+
+# Field values and objects repeat across devices.
+PANOS_CACHE_SIZE = 8192
+
+_AMPERSAND = re.compile(r' ?& ?')
+
+
+@lru_cache(maxsize=PANOS_CACHE_SIZE)
+def _normalize(x):
+    # PAN-OS device dictionary does not allow & in fields and
+    # normalizes to ' and '.
+    n = x.count('&')
+    if n == 0:
         return x
+    if n == 1:
+        return _AMPERSAND.sub(' and ', x)
+    # adjacent ampersands: keep the result of the replace passes
+    for s in [' & ', ' &', '& ', '&']:
+        x = x.replace(s, ' and ')
+    return x
+
+
+@lru_cache(maxsize=PANOS_CACHE_SIZE)
+def _name(key):
+    # key is the sorted object items
+    h = blake2b(str(list(key)).encode(),
+                digest_size=15)
+    return h.hexdigest()
+
+
+def panos_cache_info():
+    return {
+        'normalize': _normalize.cache_info(),
+        'name': _name.cache_info(),
+    }
+
 
+def panos_cache_clear():
+    _normalize.cache_clear()
+    _name.cache_clear()
+
+
+class _DeviceObjects:
     keymap = {
         # IoT security  PAN-OS device-object
         'os_combined': 'os',
@@ -72,41 +101,68 @@ def panos_device_objects(*,
         'vendor':      'vendor',
     }
 
-    if format not in ['set', 'xml', 'xml2', 'xml3']:
-        raise ArgsError('invalid format: "%s"' % format)
-
-    if filter is not None and filter:
-        if not isinstance(filter, list):
-            raise ArgsError('filter not list')
-        for x in filter:
-            if x not in keymap.values():
-                raise ArgsError('invalid filter item: "%s"' % x)
-        new = {}
-        for k, v in keymap.items():
-            if v in filter:
-                new[k] = keymap[k]
-        if not new:
-            raise ArgsError('all keys filtered')
-        keymap = new
+    xpaths = {
+        # firewall
+        'xml2': ("/config/devices/entry[@name='localhost.localdomain']"
+                 "/vsys/entry[@name='vsys1']/device-object"),
+        # Panorama
+        'xml3': '/config/shared/device-object',
+    }
 
-    panos_objects = []
-    if data is None:
-        return panos_objects
-    if not isinstance(data, list):
-        raise ArgsError('data not list')
+    def __init__(self, format=None, filter=None, min_confidence=50,
+                 dedup=True, chunk_size=None):
+        if format not in ['set', 'xml', 'xml2', 'xml3']:
+            raise ArgsError('invalid format: "%s"' % format)
+        if chunk_size is not None:
+            if not isinstance(chunk_size, int) or chunk_size < 1:
+                raise ArgsError('chunk_size must be an integer > 0')
+            if format not in ['xml2', 'xml3']:
+                raise ArgsError('chunk_size requires format xml2 or xml3')
+
+        keymap = self.keymap
+        if filter is not None and filter:
+            if not isinstance(filter, list):
+                raise ArgsError('filter not list')
+            for x in filter:
+                if x not in keymap.values():
+                    raise ArgsError('invalid filter item: "%s"' % x)
+            new = {}
+            for k, v in keymap.items():
+                if v in filter:
+                    new[k] = keymap[k]
+            if not new:
+                raise ArgsError('all keys filtered')
+            keymap = new
+
+        self.format = format
+        self.keymap = keymap
+        self.min_confidence = min_confidence
+        self.dedup = dedup
+        self.chunk_size = chunk_size
+        self.seen = set()
+        self.id = 0
+        self.chunk = None
+
+    @staticmethod
+    def name(x):
+        return _name(tuple(sorted(x.items())))
+
+    @staticmethod
+    def normalize(x):
+        return _normalize(x)
 
-    for obj in data:
+    def device_object(self, obj):
         if not isinstance(obj, dict):
             raise ArgsError('data item not dict')
 
         # Skip object when confidence score not > 50; the PAN-OS
         # device dictionary doesn't store these profiles.
         if ('confidence_score' in obj and
-           not obj['confidence_score'] > min_confidence):
-            continue
+           not obj['confidence_score'] > self.min_confidence):
+            return
 
         x = {}
-        for key in keymap:
+        for key in self.keymap:
             if key in obj and obj[key]:
                 # Skip os_combined with no version; the PAN-OS device
                 # dictionary doesn't store these.
@@ -114,77 +170,394 @@ def panos_device_objects(*,
                     ('os/firmware_version' not in obj or
                      not obj['os/firmware_version'])):
                     continue
-                x[keymap[key]] = normalize(obj[key])
+                x[self.keymap[key]] = self.normalize(obj[key])
 
         if x:
             if 'vertical' in obj:
                 x['description'] = obj['vertical']
-            if not dedup and 'deviceid' in obj:
+            if not self.dedup and 'deviceid' in obj:
                 x['description'] = obj['deviceid']
+            return x
+
+    def set_command(self, obj):
+        prefix = 'set device-object %s %s "%s"'
+        x = []
+        name = self.name(obj)
+        for key in obj:
+            x.append(prefix % (name, key, obj[key]))
+
+        return '\n'.join(x)
+
+    def entry(self, obj, parent=None):
+        attrib = {'name': self.name(obj)}
+        if parent is None:
+            entry = etree.Element('entry', attrib)
+        else:
+            entry = etree.SubElement(parent, 'entry', attrib)
+        for key in obj:
+            member = etree.SubElement(entry, key)
+            if key == 'description':
+                member.text = obj[key]
+            else:
+                etree.SubElement(member, 'member').text = obj[key]
+
+        return entry
+
+    def action(self, obj, parent=None):
+        # action=multi-config set action
+        self.id += 1
+        attrib = {'id': str(self.id), 'xpath': self.xpaths[self.format]}
+        if parent is None:
+            action = etree.Element('set', attrib)
+        else:
+            action = etree.SubElement(parent, 'set', attrib)
+        self.entry(obj, action)
+
+        return action
+
+    def root(self):
+        if self.format == 'xml':
+            return etree.Element('device-object')
+        # set action ids are per document
+        self.id = 0
+        return etree.Element('multi-config')
+
+    def chunked(self, obj):
+        # Add a set action to the current multi-config document and
+        # return the document when it has chunk_size actions.
+        if self.chunk is None:
+            self.chunk = self.root()
+        self.action(obj, self.chunk)
+        if len(self.chunk) == self.chunk_size:
+            chunk, self.chunk = self.chunk, None
+            return chunk
+
+    def flush(self):
+        # Return the last partial multi-config document, if any.
+        chunk, self.chunk = self.chunk, None
+        return chunk
+
+    @staticmethod
+    def item(obj):
+        if isinstance(obj, tuple):
+            # (ok, item) from *_all()
+            ok, obj = obj
+            if not ok:
+                status = getattr(obj, 'status', getattr(obj, 'status_code',
+                                                        None))
+                raise ApiError('data item not ok: %s %s' %
+                               (status, getattr(obj, 'reason', None)))
+
+        return obj
+
+    def convert(self, obj):
+        # Return the set command or XML element for a data item, or
+        # None when the item is skipped.
+        x = self.device_object(self.item(obj))
+        if x is None:
+            return
+
+        if self.dedup:
+            key = tuple(sorted(x.items()))
+            if key in self.seen:
+                return
+            self.seen.add(key)
+
+        if self.format == 'set':
+            return self.set_command(x)
+        if self.format == 'xml':
+            return self.entry(x)
+        if self.chunk_size is not None:
+            return self.chunked(x)
+        return self.action(x)
+
+
+def _dedup_last(panos_objects):
+    # Keep the last occurrence of each object, in order.
+    seen = set()
+    new = []
+    for x in reversed(panos_objects):
+        key = tuple(sorted(x.items()))
+        if key not in seen:
+            seen.add(key)
+            new.append(x)
+    new.reverse()
+
+    return new
+
+
+def _panos_shard(args):
+    # process pool worker for panos_device_objects_parallel()
+    data, filter, min_confidence, dedup = args
+    converter = _DeviceObjects(format='set',
+                               filter=filter,
+                               min_confidence=min_confidence,
+                               dedup=dedup)
+    panos_objects = []
+    for obj in data:
+        x = converter.device_object(obj)
+        if x:
             panos_objects.append(x)
 
-    if dedup:
-        new = []
-        for i in range(len(panos_objects)):
-            if panos_objects[i] not in panos_objects[i + 1:]:
-                new.append(panos_objects[i])
-        panos_objects = new
+    return _dedup_last(panos_objects) if dedup else panos_objects
 
-    if format == 'set':
-        prefix = 'set device-object %s %s "%s"'
-        objects_set = []
-        for obj in panos_objects:
-            x = []
-            name = _name(obj)
-            for key in obj:
-                x.append(prefix % (name, key, obj[key]))
-            objects_set.append('\n'.join(x))
 
-        return objects_set
+def _panos_format(converter, panos_objects):
+    if converter.format == 'set':
+        return [converter.set_command(obj) for obj in panos_objects]
 
-    if format == 'xml':
-        root = etree.Element('device-object')
-        for obj in panos_objects:
-            name = _name(obj)
-            entry = etree.SubElement(root, 'entry',
-                                     {'name': name})
-            for key in obj:
-                member = etree.SubElement(entry, key)
-                if key == 'description':
-                    member.text = obj[key]
-                else:
-                    etree.SubElement(member, 'member').text = obj[key]
-
-        return [root]
-
-    if format in ['xml2', 'xml3']:  # XXX
-        # action=multi-config document
-        if format == 'xml2':
-            # firewall
-            xpath = ("/config/devices/entry[@name='localhost.localdomain']"
-                     "/vsys/entry[@name='vsys1']/device-object")
-        elif format == 'xml3':
-            # Panorama
-            xpath = '/config/shared/device-object'
-
-        id = 0
-        root = etree.Element('multi-config')
+    if converter.chunk_size is not None and panos_objects:
+        # multiple action=multi-config documents
+        roots = []
         for obj in panos_objects:
-            id += 1
-            action = etree.SubElement(root, 'set',
-                                      {'id': str(id),
-                                       'xpath': xpath})
-            name = _name(obj)
-            entry = etree.SubElement(action, 'entry',
-                                     {'name': name})
-            for key in obj:
-                member = etree.SubElement(entry, key)
-                if key == 'description':
-                    member.text = obj[key]
-                else:
-                    etree.SubElement(member, 'member').text = obj[key]
-
-        return [root]
+            x = converter.chunked(obj)
+            if x is not None:
+                roots.append(x)
+        x = converter.flush()
+        if x is not None:
+            roots.append(x)
+
+        return roots
+
+    root = converter.root()
+    for obj in panos_objects:
+        if converter.format == 'xml':
+            converter.entry(obj, root)
+        else:
+            converter.action(obj, root)
+
+    return [root]
+
+
+def panos_device_objects(*,
+                         data=None,
+                         format=None,
+                         filter=None,
+                         min_confidence=50,
+                         dedup=True,
+                         chunk_size=None):
+    converter = _DeviceObjects(format=format,
+                               filter=filter,
+                               min_confidence=min_confidence,
+                               dedup=dedup,
+                               chunk_size=chunk_size)
+
+    panos_objects = []
+    if data is None:
+        return panos_objects
+    if not isinstance(data, list):
+        raise ArgsError('data not list')
+
+    for obj in data:
+        x = converter.device_object(obj)
+        if x:
+            panos_objects.append(x)
+
+    if dedup:
+        panos_objects = _dedup_last(panos_objects)
+
+    return _panos_format(converter, panos_objects)
+
+
+def panos_device_objects_parallel(*,
+                                  data=None,
+                                  format=None,
+                                  filter=None,
+                                  min_confidence=50,
+                                  dedup=True,
+                                  chunk_size=None,
+                                  processes=None,
+                                  shard_size=10000):
+    # panos_device_objects() using a process pool: data (any
+    # iterable) is split into shards of shard_size devices which are
+    # converted and deduplicated in worker processes, then merged
+    # with a global dedup.  The last occurrence order is kept by the
+    # shard dedup, so the result is the same as
+    # panos_device_objects().
+    import concurrent.futures
+    import itertools
+
+    converter = _DeviceObjects(format=format,
+                               filter=filter,
+                               min_confidence=min_confidence,
+                               dedup=dedup,
+                               chunk_size=chunk_size)
+    if processes is not None and (not isinstance(processes, int) or
+                                  processes < 1):
+        raise ArgsError('processes must be an integer > 0')
+    if not isinstance(shard_size, int) or shard_size < 1:
+        raise ArgsError('shard_size must be an integer > 0')
+
+    panos_objects = []
+    if data is None:
+        return panos_objects
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    data = iter(data)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes) as executor:
+        # bound the shards in memory for large iterables
+        max_pending = 2 * processes
+        pending = []
+        while True:
+            shard = list(itertools.islice(data, shard_size))
+            if shard:
+                pending.append(executor.submit(
+                    _panos_shard,
+                    (shard, filter, min_confidence, dedup)))
+            if pending and (not shard or len(pending) >= max_pending):
+                panos_objects.extend(pending.pop(0).result())
+            if not shard and not pending:
+                break
+
+    if dedup:
+        panos_objects = _dedup_last(panos_objects)
+
+    return _panos_format(converter, panos_objects)
+
+
+def panos_device_objects_diff(*,
+                              data=None,
+                              names=None,
+                              filter=None,
+                              min_confidence=50,
+                              dedup=True):
+    # Return (commands, names): set commands for objects not in names
+    # (the object names from a previous run), preceded by delete
+    # commands for the names no longer present, and the current
+    # object names.  Object names are a hash of the object, so a
+    # changed object is a delete and a set.
+    converter = _DeviceObjects(format='set',
+                               filter=filter,
+                               min_confidence=min_confidence,
+                               dedup=dedup)
+
+    current = {}
+    if data is not None:
+        for obj in data:
+            x = converter.device_object(converter.item(obj))
+            if x is not None:
+                current.setdefault(converter.name(x), x)
+
+    previous = set() if names is None else set(names)
+    commands = ['delete device-object %s' % name
+                for name in sorted(previous - current.keys())]
+    for name, x in current.items():
+        if name not in previous:
+            commands.append(converter.set_command(x))
+
+    return commands, set(current)
+
+
+def panos_device_objects_iter(*,
+                              data=None,
+                              format=None,
+                              filter=None,
+                              min_confidence=50,
+                              dedup=True,
+                              chunk_size=None):
+    # Incremental panos_device_objects(): data can be any iterable,
+    # including the (ok, item) tuples from *_all(), and set commands
+    # or XML elements (xml: entry, xml2/xml3: set action, or
+    # multi-config document of chunk_size actions) are yielded as they
+    # are converted.  dedup keeps the first occurrence.
+    converter = _DeviceObjects(format=format,
+                               filter=filter,
+                               min_confidence=min_confidence,
+                               dedup=dedup,
+                               chunk_size=chunk_size)
+
+    def generator():
+        if data is None:
+            return
+        for obj in data:
+            x = converter.convert(obj)
+            if x is not None:
+                yield x
+        if chunk_size is not None:
+            x = converter.flush()
+            if x is not None:
+                yield x
+
+    return generator()
+
+
+def panos_device_objects_aiter(*,
+                               data=None,
+                               format=None,
+                               filter=None,
+                               min_confidence=50,
+                               dedup=True,
+                               chunk_size=None):
+    # panos_device_objects_iter() for an asynchronous iterable.
+    converter = _DeviceObjects(format=format,
+                               filter=filter,
+                               min_confidence=min_confidence,
+                               dedup=dedup,
+                               chunk_size=chunk_size)
+
+    async def generator():
+        if data is None:
+            return
+        async for obj in data:
+            x = converter.convert(obj)
+            if x is not None:
+                yield x
+        if chunk_size is not None:
+            x = converter.flush()
+            if x is not None:
+                yield x
+
+    return generator()
+
+
+def _xml_escape(x):
+    # same as xml.dom.minidom
+    return (x.replace('&', '&amp;').replace('<', '&lt;').
+            replace('"', '&quot;').replace('>', '&gt;'))
+
+
+def panos_xml_write(element, file=None, level=0, indent='  '):
+    # Write an ElementTree element to file as
+    # minidom.toprettyxml(indent=indent) without the XML declaration,
+    # with PAN-OS indent by default, without building a DOM.
+    if file is None:
+        file = sys.stdout
+    write = file.write
+
+    def text(x, prefix):
+        # XML parsers normalize line ends in character data
+        x = x.replace('\r\n', '\n').replace('\r', '\n')
+        write('%s%s\n' % (prefix, _xml_escape(x)))
+
+    def element_(elem, prefix):
+        write('%s<%s' % (prefix, elem.tag))
+        for k, v in elem.attrib.items():
+            write(' %s="%s"' % (k, _xml_escape(v)))
+
+        if not elem.text and not len(elem):
+            write('/>\n')
+            return
+
+        write('>')
+        if not len(elem):
+            write(_xml_escape(elem.text.replace('\r\n', '\n').
+                              replace('\r', '\n')))
+        else:
+            write('\n')
+            child_prefix = prefix + indent
+            if elem.text:
+                text(elem.text, child_prefix)
+            for child in elem:
+                element_(child, child_prefix)
+                if child.tail:
+                    text(child.tail, child_prefix)
+            write(prefix)
+        write('</%s>\n' % elem.tag)
+
+    element_(element, indent * level)
 
 
 class ApiVersion(namedtuple('api_version',
@@ -198,6 +571,10 @@ class ApiVersion(namedtuple('api_version',
 
 
 def _isaio():
+    # No event loop can be running if asyncio was not imported.
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is None:
+        return False
     try:
         asyncio.get_running_loop()
         return True
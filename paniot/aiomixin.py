@@ -0,0 +1,199 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+import aiohttp
+import json
+import logging
+import multidict
+import os
+import ssl
+import yarl
+
+from . import ArgsError, DEBUG1, DEBUG2, DEBUG3
+from .mixin import _MixinShared
+
+# SSL contexts shared by IotApi instances, keyed by verify
+_ssl_contexts = {}
+
+
+class _CachedContent:
+    def __init__(self, body):
+        self._body = body
+
+    async def iter_chunked(self, n):
+        for i in range(0, len(self._body), n):
+            yield self._body[i:i + n]
+
+
+class _CachedResponse:
+    # ClientResponse interface for an HttpCache entry
+    def __init__(self, url, entry):
+        self.url = yarl.URL(url)
+        self.status = entry.status
+        self.reason = entry.reason
+        headers = multidict.CIMultiDict(entry.headers)
+        headers['content-length'] = str(len(entry.body))
+        self.headers = multidict.CIMultiDictProxy(headers)
+        self.content = _CachedContent(entry.body)
+        self._body = entry.body
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    def raise_for_status(self):
+        pass
+
+    def release(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding=None, errors='strict'):
+        return self._body.decode(encoding or 'utf-8', errors)
+
+    async def json(self, *, encoding=None, loads=json.loads,
+                   content_type='application/json'):
+        return loads(self._body.decode(encoding or 'utf-8'))
+
+
+class AioMixin(_MixinShared):
+    async def __aenter__(self):
+        self._log(DEBUG2, '%s', '__aenter__')
+        return self
+
+    async def __aexit__(self, *args):
+        self._log(DEBUG2, '%s', '__aexit__')
+        if not self.session.closed:
+            self._log(DEBUG1, 'closing aiohttp session')
+            await self.session.close()
+
+    def _timeout(self, timeout):
+        if timeout is None:
+            return
+
+        if isinstance(timeout, tuple):
+            if len(timeout) != 2:
+                raise ArgsError('timeout tuple length must be 2')
+            x = aiohttp.ClientTimeout(sock_connect=timeout[0],
+                                      sock_read=timeout[1])
+        else:
+            x = aiohttp.ClientTimeout(total=timeout)
+
+        return x
+
+    def _ssl_context(self, verify):
+        key = verify
+        if not (verify is None or isinstance(verify, bool)):
+            # reload CA file when modified
+            try:
+                key = verify, os.stat(verify).st_mtime_ns
+            except OSError as e:
+                raise ValueError('%s: %s' % (verify, e))
+        if key in _ssl_contexts:
+            return _ssl_contexts[key]
+
+        context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
+
+        if isinstance(verify, bool):
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+        elif verify is not None:
+            try:
+                context.load_verify_locations(cafile=verify)
+            except (FileNotFoundError, ssl.SSLError) as e:
+                raise ValueError('%s: %s' % (verify, e))
+
+        _ssl_contexts[key] = context
+
+        return context
+
+    def _connector(self, pool, connector=None):
+        if connector is not None:
+            if not isinstance(connector, aiohttp.BaseConnector):
+                raise ArgsError('connector not aiohttp.BaseConnector')
+            if any(x is not None for x in pool.values()):
+                raise ArgsError('connector and connection pool options '
+                                'cannot be used at the same time')
+            return connector
+
+        kwargs = {}
+        if pool['pool_size'] is not None:
+            kwargs['limit'] = pool['pool_size']
+        if pool['pool_size_per_host'] is not None:
+            kwargs['limit_per_host'] = pool['pool_size_per_host']
+        if pool['keepalive_timeout'] is not None:
+            kwargs['keepalive_timeout'] = pool['keepalive_timeout']
+        if pool['dns_cache_ttl'] is not None:
+            kwargs['ttl_dns_cache'] = pool['dns_cache_ttl']
+        if pool['tcp_nodelay'] is False:
+            # aiohttp always sets TCP_NODELAY
+            self._log(DEBUG1, 'tcp_nodelay=False ignored for aiohttp')
+
+        if not kwargs:
+            return
+
+        self._log(DEBUG2, 'TCPConnector: %s', kwargs)
+        return aiohttp.TCPConnector(**kwargs)
+
+    def _session(self, auth=None, timeout=None, connector=None,
+                 connector_owner=True):
+        async def on_request_start(session, trace_config_ctx, params):
+            log = logging.getLogger(__name__).log
+            log(DEBUG2, '%s %s', params.method, params.url)
+            for k, v in params.headers.items():
+                x = '*' * 6 if k == 'X-Access-Key' else v
+                log(DEBUG3, '%s: %s', k, x)
+
+        async def on_request_chunk_sent(session, trace_config_ctx, params):
+            log = logging.getLogger(__name__).log
+            if params.chunk:
+                log(DEBUG3, '%s', params.chunk)
+
+        async def on_request_end(session, trace_config_ctx, params):
+            log = logging.getLogger(__name__).log
+            log(DEBUG1, '%s %s %s %s %s',
+                params.method,
+                params.url,
+                params.response.status,
+                params.response.reason,
+                params.response.headers.get('content-length'))
+            for k, v in params.response.headers.items():
+                log(DEBUG3, '%s: %s', k, v)
+
+        kwargs = {}
+        if auth is not None:
+            kwargs['headers'] = auth
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if connector is not None:
+            kwargs['connector'] = connector
+            kwargs['connector_owner'] = connector_owner
+
+        if (logging.getLogger(__name__).getEffectiveLevel() in
+           [DEBUG1, DEBUG2, DEBUG3]):
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_start.append(on_request_start)
+            trace_config.on_request_chunk_sent.append(on_request_chunk_sent)
+            trace_config.on_request_end.append(on_request_end)
+            kwargs['trace_configs'] = [trace_config]
+
+        return aiohttp.ClientSession(**kwargs)
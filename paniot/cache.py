@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+from collections import namedtuple, OrderedDict
+import threading
+import time
+
+from . import ArgsError
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'negative_hits',
+                                     'evictions', 'maxsize', 'currsize'])
+
+
+class TtlCache:
+    def __init__(self, *, ttl=300, negative_ttl=60, maxsize=10000):
+        for k, v in [('ttl', ttl), ('negative_ttl', negative_ttl)]:
+            if v < 0:
+                raise ArgsError('%s must be >= 0' % k)
+        if not isinstance(maxsize, int) or maxsize < 1:
+            raise ArgsError('maxsize must be an integer > 0')
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        # key: (expires, negative, value), least recently used first
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.clear()
+
+    def _time(self):
+        return time.monotonic()
+
+    def get(self, key):
+        with self._lock:
+            x = self._items.get(key)
+            if x is not None and x[0] <= self._time():
+                del self._items[key]
+                x = None
+            if x is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            if x[1]:
+                self.negative_hits += 1
+
+        return x[2]
+
+    def put(self, key, value, negative=False):
+        ttl = self.negative_ttl if negative else self.ttl
+        if ttl == 0:
+            return
+
+        with self._lock:
+            self._items[key] = (self._time() + ttl, negative, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+            self.negative_hits = 0
+            self.evictions = 0
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.negative_hits,
+                             self.evictions, self.maxsize, len(self._items))
@@ -0,0 +1,119 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+from collections import namedtuple
+from hashlib import sha256
+import json
+import os
+import tempfile
+import time
+
+from . import ArgsError
+
+# response headers saved with the body
+HEADERS = ['content-type', 'etag', 'last-modified', 'date']
+
+Entry = namedtuple('Entry', ['status', 'reason', 'headers', 'body', 'time'])
+
+
+class HttpCache:
+    def __init__(self, path, *, ttl=3600):
+        if ttl < 0:
+            raise ArgsError('ttl must be >= 0')
+        self.path = path
+        self.ttl = ttl
+        try:
+            os.makedirs(path, mode=0o700, exist_ok=True)
+        except OSError as e:
+            raise ArgsError('%s: %s' % (path, e))
+
+    def _time(self):
+        # shared by processes, so use wall clock time
+        return time.time()
+
+    def _path(self, url, params):
+        x = json.dumps([url, sorted(params.items())], default=str)
+        return os.path.join(self.path,
+                            sha256(x.encode()).hexdigest() + '.cache')
+
+    def get(self, url, params):
+        # A file is a JSON header line followed by the body.
+        try:
+            with open(self._path(url, params), 'rb') as f:
+                x = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        try:
+            return Entry(x['status'], x['reason'], x['headers'], body,
+                         x['time'])
+        except (KeyError, TypeError):
+            return None
+
+    def fresh(self, entry):
+        return self._time() - entry.time < self.ttl
+
+    def validators(self, entry):
+        headers = {}
+        if 'etag' in entry.headers:
+            headers['If-None-Match'] = entry.headers['etag']
+        if 'last-modified' in entry.headers:
+            headers['If-Modified-Since'] = entry.headers['last-modified']
+
+        return headers
+
+    def put(self, url, params, status, reason, headers, body):
+        x = {k: headers[k] for k in HEADERS if k in headers}
+        entry = Entry(status, reason, x, body, self._time())
+        header = {
+            'status': entry.status,
+            'reason': entry.reason,
+            'headers': entry.headers,
+            'time': entry.time,
+        }
+        # the cache is an optimization; a write error is not fatal
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.path)
+        except OSError:
+            return entry
+        try:
+            with open(fd, 'wb') as f:
+                f.write(json.dumps(header).encode() + b'\n')
+                f.write(body)
+            os.replace(tmp, self._path(url, params))
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+        return entry
+
+    def revalidated(self, url, params, entry, headers):
+        # 304 Not Modified: keep the body with updated validators
+        x = dict(entry.headers)
+        x.update({k: headers[k] for k in HEADERS if k in headers})
+
+        return self.put(url, params, entry.status, entry.reason, x,
+                        entry.body)
+
+    def clear(self):
+        for x in os.listdir(self.path):
+            if x.endswith('.cache'):
+                try:
+                    os.unlink(os.path.join(self.path, x))
+                except OSError:
+                    pass
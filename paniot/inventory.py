@@ -0,0 +1,148 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+import logging
+
+from . import ApiError, ArgsError, DEBUG1
+from .store import _mark, _page_error
+
+INDEXES = {
+    # index: device field
+    'ip': 'ip_address',
+    'mac': 'mac_address',
+    'profile': 'profile',
+    'category': 'category',
+    'vendor': 'vendor',
+}
+
+
+class Inventory:
+    def __init__(self, devices=None, *, overlap=60):
+        self._log = logging.getLogger(__name__).log
+        self.overlap = overlap
+        self.stime = None
+        self._clear()
+        if devices is not None:
+            for x in devices:
+                self.add(x)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __contains__(self, deviceid):
+        return deviceid in self.devices
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def _clear(self):
+        self.devices = {}
+        # index: {value: {deviceid: device}}
+        self.indexes = {x: {} for x in INDEXES}
+
+    def add(self, device):
+        try:
+            deviceid = device['deviceid']
+        except (KeyError, TypeError):
+            raise ArgsError('device missing deviceid')
+        if deviceid in self.devices:
+            self.remove(deviceid)
+
+        self.devices[deviceid] = device
+        for name, field in INDEXES.items():
+            value = device.get(field)
+            if value:
+                self.indexes[name].setdefault(value, {})[deviceid] = device
+
+    def remove(self, deviceid):
+        device = self.devices.pop(deviceid)
+        for name, field in INDEXES.items():
+            value = device.get(field)
+            if value:
+                x = self.indexes[name][value]
+                del x[deviceid]
+                if not x:
+                    del self.indexes[name][value]
+
+    def get(self, deviceid):
+        return self.devices.get(deviceid)
+
+    def find(self, index, value):
+        if index == 'deviceid':
+            device = self.devices.get(value)
+            return [] if device is None else [device]
+        if index not in self.indexes:
+            raise ArgsError('invalid index: "%s"' % index)
+
+        return list(self.indexes[index].get(value, {}).values())
+
+    def _begin(self, full, detail):
+        mark = _mark(self.overlap)
+        stime = self.stime
+        if full or stime is None:
+            # Rebuild in a new inventory so lookups see the current
+            # devices until the refresh is complete.
+            target = Inventory(overlap=self.overlap)
+            stime = None
+        else:
+            target = self
+        self._log(DEBUG1, 'devices: stime %s', stime)
+
+        return mark, target, {'stime': stime, 'detail': detail}
+
+    def _add_page(self, ok, page):
+        if not ok:
+            raise _page_error('devices', page)
+        for x in page.items:
+            try:
+                self.add(x)
+            except ArgsError as e:
+                raise ApiError('devices: %s' % e)
+
+        return len(page.items)
+
+    def _end(self, mark, target, total):
+        if target is not self:
+            self.devices, self.indexes = target.devices, target.indexes
+        self.stime = mark
+        self._log(DEBUG1, 'devices: %d updated, %d total, stime %s',
+                  total, len(self.devices), mark)
+
+    def refresh(self, api, *, full=False, detail=True):
+        mark, target, kwargs = self._begin(full, detail)
+        total = 0
+        pages = api.devices_pages(**kwargs)
+        try:
+            for ok, page in pages:
+                total += target._add_page(ok, page)
+        finally:
+            pages.close()
+        self._end(mark, target, total)
+
+        return total
+
+    async def aiorefresh(self, api, *, full=False, detail=True):
+        mark, target, kwargs = self._begin(full, detail)
+        total = 0
+        pages = api.devices_pages(**kwargs)
+        try:
+            async for ok, page in pages:
+                total += target._add_page(ok, page)
+        finally:
+            await pages.aclose()
+        self._end(mark, target, total)
+
+        return total
@@ -0,0 +1,76 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+from collections import namedtuple
+import json
+
+from . import ArgsError
+
+# Fastest first.  The codec modules are imported when a codec is
+# selected.
+CODECS = ['orjson', 'ujson', 'json']
+
+JsonCodec = namedtuple('JsonCodec', ['name', 'loads', 'dumps'])
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj, sort_keys=False):
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        return orjson.dumps(obj, option=option).decode()
+
+    return JsonCodec('orjson', orjson.loads, dumps)
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj, sort_keys=False):
+        return ujson.dumps(obj, sort_keys=sort_keys,
+                           escape_forward_slashes=False)
+
+    return JsonCodec('ujson', ujson.loads, dumps)
+
+
+def _json():
+    def dumps(obj, sort_keys=False):
+        return json.dumps(obj, sort_keys=sort_keys,
+                          separators=(',', ':'))
+
+    return JsonCodec('json', json.loads, dumps)
+
+
+_codecs = {}
+
+
+def codec(name=None):
+    # Return the named JSON codec, or the fastest installed codec
+    # when name is None.  loads() accepts bytes or str, dumps()
+    # returns compact str.
+    if name is not None and name not in CODECS:
+        raise ArgsError('invalid json_codec: "%s"' % name)
+
+    for x in CODECS if name is None else [name]:
+        if x not in _codecs:
+            try:
+                _codecs[x] = globals()['_' + x]()
+            except ImportError:
+                _codecs[x] = None
+        if _codecs[x] is not None:
+            return _codecs[x]
+
+    raise ArgsError('json_codec not installed: "%s"' % name)
@@ -0,0 +1,160 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+import codecs
+import json
+import re
+
+_WS = re.compile(r'[ \t\n\r]*')
+# read size for response bodies
+CHUNK_SIZE = 64 * 1024
+
+_NEED = object()
+
+
+class ArrayParser:
+    # Incremental parser for the array at keys in a JSON object
+    # response, for example ['devices'] or ['items', 'items'].  feed()
+    # returns the array items completed by the data, so only the
+    # current item and the unparsed data are in memory.  The top
+    # level 'total' value is saved in total.  A missing key raises
+    # KeyError and invalid JSON raises ValueError.
+    def __init__(self, keys):
+        self.keys = keys
+        self.total = None
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._parser = self._parse()
+        self._done = False
+
+    def feed(self, data):
+        if self._pos > CHUNK_SIZE:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        self._buf += self._text.decode(data)
+
+        return self._run()
+
+    def close(self):
+        self._buf += self._text.decode(b'', final=True)
+        self._eof = True
+        items = self._run()
+        if not self._done:
+            raise ValueError('incomplete JSON document')
+
+        return items
+
+    def _run(self):
+        items = []
+        if self._done:
+            return items
+        for x in self._parser:
+            if x is _NEED:
+                return items
+            items.append(x)
+        self._done = True
+
+        return items
+
+    def _error(self, msg):
+        return ValueError('%s at offset %d' % (msg, self._pos))
+
+    def _peek(self):
+        while True:
+            self._pos = _WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                raise self._error('unexpected end of JSON document')
+            yield _NEED
+
+    def _value(self):
+        while True:
+            yield from self._peek()
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+                yield _NEED
+                continue
+            # A number can be incomplete, for example 12 of 12.5e3;
+            # wait for the delimiter that follows the value.
+            if not self._eof and (end == len(self._buf) or
+                                  (isinstance(obj, (int, float)) and
+                                   self._buf[end] in '.eE+-')):
+                yield _NEED
+                continue
+            self._pos = end
+            return obj
+
+    def _expect(self, chars):
+        c = yield from self._peek()
+        if c not in chars:
+            raise self._error('expecting one of %s' % repr(chars))
+        self._pos += 1
+        return c
+
+    def _parse(self):
+        yield from self._object(self.keys, 0)
+        self._pos = _WS.match(self._buf, self._pos).end()
+
+    def _object(self, keys, depth):
+        yield from self._expect('{')
+        found = False
+        c = yield from self._peek()
+        if c == '}':
+            self._pos += 1
+            raise KeyError(keys[0])
+
+        while True:
+            key = yield from self._value()
+            if not isinstance(key, str):
+                raise self._error('expecting object key')
+            yield from self._expect(':')
+            if not found and key == keys[0]:
+                found = True
+                if len(keys) == 1:
+                    yield from self._array()
+                else:
+                    yield from self._object(keys[1:], depth + 1)
+            else:
+                value = yield from self._value()
+                if depth == 0 and key == 'total':
+                    self.total = value
+            c = yield from self._expect(',}')
+            if c == '}':
+                break
+
+        if not found:
+            raise KeyError(keys[0])
+
+    def _array(self):
+        yield from self._expect('[')
+        c = yield from self._peek()
+        if c == ']':
+            self._pos += 1
+            return
+
+        while True:
+            x = yield from self._value()
+            yield x
+            c = yield from self._expect(',]')
+            if c == ']':
+                return
@@ -14,15 +14,79 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
-import aiohttp
 import base64
+from datetime import datetime, timezone
+import email.utils
 import json
-import logging
-import requests
-import requests.adapters
-import ssl
+import random
+import time
 
-from . import ArgsError, DEBUG1, DEBUG2, DEBUG3
+from . import ArgsError, DEBUG1, DEBUG2, jsoncodec
+from .cache import TtlCache
+from .httpcache import HttpCache
+from .ratelimit import RateLimiter
+
+RETRY_STATUS = (429, 502, 503, 504)
+TRANSIENT_RETRIES = 3
+
+
+def _retry_after(headers):
+    # Retry-After is delay-seconds or an HTTP-date; RateLimit-Reset
+    # (draft-ietf-httpapi-ratelimit-headers) is delay-seconds.
+    for k in ['retry-after', 'ratelimit-reset']:
+        x = headers.get(k)
+        if x is None:
+            continue
+        try:
+            return max(0, float(x))
+        except ValueError:
+            pass
+        try:
+            d = email.utils.parsedate_to_datetime(x)
+        except (TypeError, ValueError):
+            continue
+        if d.tzinfo is None:
+            d = d.replace(tzinfo=timezone.utc)
+        return max(0, (d - datetime.now(tz=timezone.utc)).total_seconds())
+
+
+class _Retry:
+    def __init__(self, method, max_retries=None, deadline=None):
+        self.base = method.window / method.rate_limit
+        self.cap = method.window / 4
+        self.max_retries = max_retries
+        self.deadline = None
+        if deadline is not None:
+            self.deadline = time.monotonic() + deadline
+        self.retries = 0
+        self.transient_retries = 0
+
+    def delay(self, headers=None, transient=False):
+        # Return the time to sleep before the next retry, or None when
+        # the retry budget is exhausted.
+        if self.max_retries is not None:
+            if self.retries >= self.max_retries:
+                return None
+        elif transient and self.transient_retries >= TRANSIENT_RETRIES:
+            return None
+
+        # full jitter exponential backoff, added to any server delay
+        delay = random.uniform(0, min(self.cap,
+                                      self.base * 2 ** self.retries))
+        if headers is not None:
+            x = _retry_after(headers)
+            if x is not None:
+                delay += x
+
+        if (self.deadline is not None and
+           time.monotonic() + delay > self.deadline):
+            return None
+
+        self.retries += 1
+        if transient:
+            self.transient_retries += 1
+
+        return delay
 
 
 class _MixinShared:
@@ -56,6 +120,88 @@ class _MixinShared:
             func.__func__.window = attrs['window']
             func.__func__.rate_limit = attrs['rate_limit']
 
+    def _retry_options(self, max_retries, retry_deadline):
+        if max_retries is not None and max_retries < 0:
+            raise ArgsError('max_retries must be >= 0')
+        if retry_deadline is not None and retry_deadline <= 0:
+            raise ArgsError('retry_deadline must be > 0')
+        self.max_retries = max_retries
+        self.retry_deadline = retry_deadline
+
+    def _retry(self, method):
+        return _Retry(method,
+                      max_retries=self.max_retries,
+                      deadline=self.retry_deadline)
+
+    def _pool_options(self, *,
+                      pool_size=None,
+                      pool_size_per_host=None,
+                      keepalive_timeout=None,
+                      dns_cache_ttl=None,
+                      tcp_nodelay=None):
+        for k, v in [('pool_size', pool_size),
+                     ('pool_size_per_host', pool_size_per_host)]:
+            if v is not None and (not isinstance(v, int) or v < 1):
+                raise ArgsError('%s must be an integer > 0' % k)
+        for k, v in [('keepalive_timeout', keepalive_timeout),
+                     ('dns_cache_ttl', dns_cache_ttl)]:
+            if v is not None and v < 0:
+                raise ArgsError('%s must be >= 0' % k)
+
+        return {
+            'pool_size': pool_size,
+            'pool_size_per_host': pool_size_per_host,
+            'keepalive_timeout': keepalive_timeout,
+            'dns_cache_ttl': dns_cache_ttl,
+            'tcp_nodelay': tcp_nodelay,
+        }
+
+    def _json_codec(self, json_codec):
+        x = jsoncodec.codec(json_codec)
+        self._log(DEBUG1, 'json_codec: %s', x.name)
+
+        return x
+
+    def _rate_limiter(self, rate_limiter):
+        if (rate_limiter is not None and
+           not isinstance(rate_limiter, RateLimiter)):
+            raise ArgsError('rate_limiter not RateLimiter')
+
+        return rate_limiter
+
+    def _cache(self, name, cache):
+        if cache is not None and not isinstance(cache, TtlCache):
+            raise ArgsError('%s not TtlCache' % name)
+
+        return cache
+
+    def _http_cache(self, http_cache):
+        if http_cache is not None and not isinstance(http_cache, HttpCache):
+            raise ArgsError('http_cache not HttpCache')
+
+        return http_cache
+
+    def _cache_key(self, url, params):
+        # None when a parameter value is not hashable
+        try:
+            key = (url, frozenset(params.items()))
+        except TypeError:
+            return None
+
+        return key
+
+    def _rate_limit_delay(self, method):
+        if self.rate_limiter is None or method is None:
+            return 0
+
+        delay = self.rate_limiter.reserve((self.customerid, method.__name__),
+                                          method.window, method.rate_limit)
+        if delay > 0:
+            self._log(DEBUG2, '%s rate limit, sleep %.2fs',
+                      method.__name__, delay)
+
+        return delay
+
     def decode_jwt(self):
         def _pad(x):
             remainder = len(x) % 4
@@ -79,124 +225,13 @@ class _MixinShared:
         return header, payload
 
 
-class AioMixin(_MixinShared):
-    async def __aenter__(self):
-        self._log(DEBUG2, '%s', '__aenter__')
-        return self
-
-    async def __aexit__(self, *args):
-        self._log(DEBUG2, '%s', '__aexit__')
-        if not self.session.closed:
-            self._log(DEBUG1, 'closing aiohttp session')
-            await self.session.close()
-
-    def _timeout(self, timeout):
-        if timeout is None:
-            return
-
-        if isinstance(timeout, tuple):
-            if len(timeout) != 2:
-                raise ArgsError('timeout tuple length must be 2')
-            x = aiohttp.ClientTimeout(sock_connect=timeout[0],
-                                      sock_read=timeout[1])
-        else:
-            x = aiohttp.ClientTimeout(total=timeout)
-
-        return x
-
-    def _ssl_context(self, verify):
-        context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
-
-        if isinstance(verify, bool):
-            if not verify:
-                context.check_hostname = False
-                context.verify_mode = ssl.CERT_NONE
-        elif verify is not None:
-            try:
-                context.load_verify_locations(cafile=verify)
-            except (FileNotFoundError, ssl.SSLError) as e:
-                raise ValueError('%s: %s' % (verify, e))
-
-        return context
-
-    def _session(self, auth=None, timeout=None):
-        async def on_request_start(session, trace_config_ctx, params):
-            log = logging.getLogger(__name__).log
-            log(DEBUG2, '%s %s', params.method, params.url)
-            for k, v in params.headers.items():
-                x = '*' * 6 if k == 'X-Access-Key' else v
-                log(DEBUG3, '%s: %s', k, x)
-
-        async def on_request_chunk_sent(session, trace_config_ctx, params):
-            log = logging.getLogger(__name__).log
-            if params.chunk:
-                log(DEBUG3, '%s', params.chunk)
-
-        async def on_request_end(session, trace_config_ctx, params):
-            log = logging.getLogger(__name__).log
-            log(DEBUG1, '%s %s %s %s %s',
-                params.method,
-                params.url,
-                params.response.status,
-                params.response.reason,
-                params.response.headers.get('content-length'))
-            for k, v in params.response.headers.items():
-                log(DEBUG3, '%s: %s', k, v)
-
-        kwargs = {}
-        if auth is not None:
-            kwargs['headers'] = auth
-        if timeout is not None:
-            kwargs['timeout'] = timeout
-
-        if (logging.getLogger(__name__).getEffectiveLevel() in
-           [DEBUG1, DEBUG2, DEBUG3]):
-            trace_config = aiohttp.TraceConfig()
-            trace_config.on_request_start.append(on_request_start)
-            trace_config.on_request_chunk_sent.append(on_request_chunk_sent)
-            trace_config.on_request_end.append(on_request_end)
-            kwargs['trace_configs'] = [trace_config]
-
-        return aiohttp.ClientSession(**kwargs)
-
-
-class _TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
-    def __init__(self, *args, **kwargs):
-        self.timeout = None
-        if 'timeout' in kwargs:
-            self.timeout = kwargs['timeout']
-            del kwargs['timeout']
-        super().__init__(*args, **kwargs)
-
-    def send(self, request, **kwargs):
-        timeout = kwargs.get('timeout')
-        if timeout is None:
-            kwargs['timeout'] = self.timeout
-        return super().send(request, **kwargs)
-
-
-class Mixin(_MixinShared):
-    def __enter__(self):
-        self._log(DEBUG2, '%s', '__enter__')
-        return self
-
-    def __exit__(self, *args):
-        self._log(DEBUG2, '%s', '__exit__')
-        self._log(DEBUG1, 'closing requests session')
-        self.session.close()
-
-    def _session(self,
-                 auth=None,
-                 verify=None,
-                 timeout=None):
-        session = requests.Session()
-
-        if auth is not None:
-            session.headers.update(auth)
-        if verify is not None:
-            session.verify = verify
-        if timeout is not None:
-            adapter = _TimeoutHTTPAdapter(timeout=timeout)
-            session.mount("https://", adapter)
-
-        return session
+def __getattr__(name):
+    # The client mixins are in separate modules so only the HTTP
+    # library of the client class used is imported.
+    if name == 'AioMixin':
+        from .aiomixin import AioMixin
+        return AioMixin
+    if name == 'Mixin':
+        from .requestsmixin import Mixin
+        return Mixin
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,130 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+import aiohttp
+import asyncio
+import json
+import logging
+
+from . import IotApi, ArgsError, DEBUG1, DEBUG2
+from .ratelimit import RateLimiter
+
+# method: arguments
+METHODS = {
+    'devices_all': ['stime', 'detail', 'query_string', 'concurrency',
+                    'ordered', 'incremental'],
+    'vulnerabilities_all': ['groupby', 'stime', 'query_string',
+                            'incremental'],
+    'alerts_all': ['stime', 'query_string', 'concurrency', 'ordered',
+                   'incremental'],
+    'policies_all': ['query_string', 'concurrency', 'ordered',
+                     'incremental'],
+}
+
+# tenants_all() default RateLimiter; None or False disables rate limiting
+_DEFAULT = object()
+
+# -F key file options
+CONFIG_KEYS = ['api-version', 'url',
+               'customerid', 'access-key-id', 'access-key',
+               'verify']
+
+
+def tenant_config(path):
+    try:
+        with open(path, 'r') as f:
+            x = json.load(f)
+    except (IOError, ValueError) as e:
+        raise ArgsError('%s: %s' % (path, e))
+
+    kwargs = {}
+    for k in CONFIG_KEYS:
+        if k in x:
+            kwargs[k.replace('-', '_')] = x[k]
+
+    return kwargs
+
+
+async def tenants_all(tenants, *,
+                      method='devices_all',
+                      max_connections=100,
+                      rate_limiter=_DEFAULT,
+                      queue_size=1000,
+                      api_kwargs=None,
+                      **kwargs):
+    _log = logging.getLogger(__name__).log
+
+    if method not in METHODS:
+        raise ArgsError('invalid method: "%s"' % method)
+    for x in kwargs:
+        if x not in METHODS[method]:
+            raise ArgsError('%s: invalid argument: "%s"' % (method, x))
+    if api_kwargs is None:
+        api_kwargs = {}
+    for x in ['rate_limiter', 'connector']:
+        if x in api_kwargs:
+            raise ArgsError('api_kwargs: %s not allowed' % x)
+    if not tenants:
+        raise ArgsError('no tenants')
+    tenants = [tenant_config(x) if isinstance(x, str) else dict(x)
+               for x in tenants]
+    if rate_limiter is _DEFAULT:
+        rate_limiter = RateLimiter()
+    elif not rate_limiter:
+        rate_limiter = None
+
+    # One connector for all tenants caps requests in flight.
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    queue = asyncio.Queue(maxsize=queue_size)
+    done = object()
+
+    async def get_all(tenant):
+        # tenant arguments override api_kwargs
+        x = dict(api_kwargs)
+        x.update(tenant)
+        try:
+            async with IotApi(rate_limiter=rate_limiter,
+                              connector=connector,
+                              **x) as api:
+                _log(DEBUG1, '%s: %s', api.customerid, method)
+                total = 0
+                async for ok, x in getattr(api, method)(**kwargs):
+                    await queue.put((api.customerid, ok, x))
+                    total += 1
+                _log(DEBUG1, '%s: %s total %d', api.customerid, method, total)
+        except Exception as e:
+            await queue.put((done, e))
+        else:
+            await queue.put((done, None))
+
+    tasks = [asyncio.ensure_future(get_all(x)) for x in tenants]
+    running = len(tasks)
+
+    try:
+        while running:
+            x = await queue.get()
+            if x[0] is done:
+                running -= 1
+                _log(DEBUG2, 'tenants running %d', running)
+                if x[1] is not None:
+                    raise x[1]
+                continue
+            yield x
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await connector.close()
@@ -0,0 +1,110 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+import json
+import os
+import threading
+import time
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from . import ArgsError
+
+
+class RateLimiter:
+    def __init__(self, *, burst=1):
+        if not isinstance(burst, int) or burst < 1:
+            raise ArgsError('burst must be an integer > 0')
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _time(self):
+        return time.monotonic()
+
+    def _bucket(self, window, rate_limit):
+        # Refill at (rate_limit - capacity) / window so a full bucket
+        # plus refill never exceeds rate_limit in any window.
+        capacity = min(self.burst, rate_limit)
+        if rate_limit > capacity:
+            rate = (rate_limit - capacity) / window
+        else:
+            rate = rate_limit / window
+
+        return capacity, rate
+
+    def _take(self, state, capacity, rate, now):
+        # Tokens can go negative: each pending reservation is a
+        # request waiting for the bucket to refill.
+        if state is None:
+            tokens = capacity
+        else:
+            tokens, last = state
+            tokens = min(capacity, tokens + (now - last) * rate)
+        tokens -= 1
+        delay = -tokens / rate if tokens < 0 else 0
+
+        return delay, (tokens, now)
+
+    def _reserve(self, key, capacity, rate):
+        with self._lock:
+            delay, self._buckets[key] = self._take(self._buckets.get(key),
+                                                   capacity, rate,
+                                                   self._time())
+
+        return delay
+
+    def reserve(self, key, window, rate_limit):
+        capacity, rate = self._bucket(window, rate_limit)
+        return self._reserve(key, capacity, rate)
+
+
+class FileRateLimiter(RateLimiter):
+    def __init__(self, path, *, burst=1):
+        if fcntl is None:
+            raise ArgsError('FileRateLimiter requires fcntl')
+        super().__init__(burst=burst)
+        self.path = path
+        try:
+            os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        except OSError as e:
+            raise ArgsError('%s: %s' % (path, e))
+
+    def _time(self):
+        # shared by processes, so use wall clock time
+        return time.time()
+
+    def _reserve(self, key, capacity, rate):
+        name = json.dumps(key)
+
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            with open(fd, 'r+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    buckets = json.loads(f.read() or '{}')
+                except ValueError:
+                    buckets = {}
+                delay, buckets[name] = self._take(buckets.get(name),
+                                                  capacity, rate,
+                                                  self._time())
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(buckets))
+
+        return delay
@@ -0,0 +1,113 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+import requests
+import requests.adapters
+import requests.structures
+import requests.utils
+import socket
+import urllib3.connection
+
+from . import DEBUG1, DEBUG2
+from .mixin import _MixinShared
+
+
+def _cached_response(url, entry):
+    # Response for an HttpCache entry
+    resp = requests.Response()
+    resp.url = url
+    resp.status_code = entry.status
+    resp.reason = entry.reason
+    resp.headers = requests.structures.CaseInsensitiveDict(entry.headers)
+    resp.headers['content-length'] = str(len(entry.body))
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    resp._content = entry.body
+    resp._content_consumed = True
+
+    return resp
+
+
+class _TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self, *args, **kwargs):
+        self.timeout = None
+        if 'timeout' in kwargs:
+            self.timeout = kwargs['timeout']
+            del kwargs['timeout']
+        self.socket_options = None
+        if 'socket_options' in kwargs:
+            self.socket_options = kwargs['socket_options']
+            del kwargs['socket_options']
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.socket_options is not None:
+            kwargs['socket_options'] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        timeout = kwargs.get('timeout')
+        if timeout is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class Mixin(_MixinShared):
+    def __enter__(self):
+        self._log(DEBUG2, '%s', '__enter__')
+        return self
+
+    def __exit__(self, *args):
+        self._log(DEBUG2, '%s', '__exit__')
+        self._log(DEBUG1, 'closing requests session')
+        self.session.close()
+
+    def _session(self,
+                 auth=None,
+                 verify=None,
+                 timeout=None,
+                 pool=None):
+        session = requests.Session()
+
+        if auth is not None:
+            session.headers.update(auth)
+        if verify is not None:
+            session.verify = verify
+
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if pool is not None:
+            size = pool['pool_size_per_host'] or pool['pool_size']
+            if size is not None:
+                kwargs['pool_maxsize'] = size
+            if pool['tcp_nodelay'] is not None:
+                x = [opt for opt in
+                     urllib3.connection.HTTPConnection.default_socket_options
+                     if opt[:2] != (socket.IPPROTO_TCP, socket.TCP_NODELAY)]
+                x.append((socket.IPPROTO_TCP, socket.TCP_NODELAY,
+                          int(pool['tcp_nodelay'])))
+                kwargs['socket_options'] = x
+            for k in ['keepalive_timeout', 'dns_cache_ttl']:
+                if pool[k] is not None:
+                    self._log(DEBUG1, '%s ignored for requests', k)
+
+        if kwargs:
+            self._log(DEBUG2, 'HTTPAdapter: %s', kwargs)
+            adapter = _TimeoutHTTPAdapter(**kwargs)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+        return session
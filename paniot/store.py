@@ -0,0 +1,186 @@
+#
+# Copyright (c) 2022 Palo Alto Networks, Inc.
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+from datetime import datetime, timedelta, timezone
+import logging
+import sqlite3
+
+from . import jsoncodec, ApiError, ArgsError, DEBUG1, DEBUG2
+
+# table: item key fields
+TABLES = {
+    'devices': ['deviceid'],
+    'alerts': ['id'],
+    'vulnerabilities': ['deviceid', 'vulnerability_name'],
+}
+
+STIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _mark(overlap):
+    # The high-water mark is the start time of the sync less the
+    # overlap, so items changed during the sync or with server
+    # clock skew are fetched again by the next sync.
+    start = datetime.now(timezone.utc)
+    return (start - timedelta(seconds=overlap)).strftime(STIME_FORMAT)
+
+
+def _page_error(name, resp):
+    status = getattr(resp, 'status', None)
+    if status is None:
+        status = resp.status_code
+    return ApiError('%s: %s %s' % (name, status, resp.reason))
+
+
+class Store:
+    def __init__(self, path, *, overlap=60, json_codec=None):
+        self._log = logging.getLogger(__name__).log
+        self.path = path
+        self.overlap = overlap
+        self.json_codec = jsoncodec.codec(json_codec)
+        try:
+            self.connection = sqlite3.connect(path)
+            self._create()
+        except sqlite3.Error as e:
+            raise ArgsError('%s: %s' % (path, e))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _create(self):
+        with self.connection as db:
+            db.execute('CREATE TABLE IF NOT EXISTS sync ('
+                       'name TEXT PRIMARY KEY, '
+                       'stime TEXT NOT NULL)')
+            for name, keys in TABLES.items():
+                columns = ''.join('%s TEXT NOT NULL, ' % x for x in keys)
+                db.execute('CREATE TABLE IF NOT EXISTS %s ('
+                           '%sitem TEXT NOT NULL, '
+                           'PRIMARY KEY (%s))' %
+                           (name, columns, ', '.join(keys)))
+
+    def _tables(self, tables):
+        if tables is None:
+            return list(TABLES)
+        for x in tables:
+            if x not in TABLES:
+                raise ArgsError('invalid table: "%s"' % x)
+        return tables
+
+    def _begin(self, name, detail):
+        mark = _mark(self.overlap)
+        stime = self.stime(name)
+        self._log(DEBUG1, '%s: stime %s', name, stime)
+
+        kwargs = {'stime': stime}
+        if name == 'devices':
+            kwargs['detail'] = detail
+        elif name == 'vulnerabilities':
+            kwargs['groupby'] = 'device'
+
+        return mark, kwargs
+
+    def _upsert(self, name, ok, page):
+        if not ok:
+            raise _page_error(name, page)
+
+        keys = TABLES[name]
+        rows = []
+        for x in page.items:
+            try:
+                row = [x[k] for k in keys]
+            except (KeyError, TypeError) as e:
+                raise ApiError('%s: item missing key %s' % (name, e))
+            row.append(self.json_codec.dumps(x))
+            rows.append(row)
+
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO %s (%s, item) VALUES (%s)' %
+            (name, ', '.join(keys), ', '.join('?' * (len(keys) + 1))),
+            rows)
+        self._log(DEBUG2, '%s: offset %d upsert %d',
+                  name, page.offset, len(rows))
+
+        return len(rows)
+
+    def _end(self, name, mark, total):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO sync (name, stime) VALUES (?, ?)',
+            (name, mark))
+        self._log(DEBUG1, '%s: %d items, stime %s', name, total, mark)
+
+    def sync(self, api, *, tables=None, detail=True):
+        counts = {}
+        for name in self._tables(tables):
+            mark, kwargs = self._begin(name, detail)
+            total = 0
+            with self.connection:
+                pages = getattr(api, name + '_pages')(**kwargs)
+                try:
+                    for ok, page in pages:
+                        total += self._upsert(name, ok, page)
+                finally:
+                    pages.close()
+                self._end(name, mark, total)
+            counts[name] = total
+
+        return counts
+
+    async def aiosync(self, api, *, tables=None, detail=True):
+        counts = {}
+        for name in self._tables(tables):
+            mark, kwargs = self._begin(name, detail)
+            total = 0
+            with self.connection:
+                pages = getattr(api, name + '_pages')(**kwargs)
+                try:
+                    async for ok, page in pages:
+                        total += self._upsert(name, ok, page)
+                finally:
+                    await pages.aclose()
+                self._end(name, mark, total)
+            counts[name] = total
+
+        return counts
+
+    def stime(self, name):
+        self._tables([name])
+        row = self.connection.execute(
+            'SELECT stime FROM sync WHERE name = ?', (name,)).fetchone()
+
+        return None if row is None else row[0]
+
+    def get(self, name, *key):
+        keys = TABLES[self._tables([name])[0]]
+        if len(key) != len(keys):
+            raise ArgsError('%s key is %s' % (name, ', '.join(keys)))
+        row = self.connection.execute(
+            'SELECT item FROM %s WHERE %s' %
+            (name, ' AND '.join('%s = ?' % x for x in keys)),
+            key).fetchone()
+
+        return None if row is None else self.json_codec.loads(row[0])
+
+    def items(self, name):
+        self._tables([name])
+        for row in self.connection.execute('SELECT item FROM %s' % name):
+            yield self.json_codec.loads(row[0])
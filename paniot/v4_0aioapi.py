@@ -19,15 +19,16 @@ import asyncio
 import logging
 import ssl
 import sys
+import time
 
-from . import (mixin, ApiError, ArgsError,
+from . import (aiomixin, jsonstream, mixin, ApiError, ArgsError, Page,
                DEBUG1, DEBUG2, DEBUG3, __version__)
 
 
 BASE_PATH = '/pub/v4.0'
 
 
-class IotApi(mixin.AioMixin):
+class IotApi(aiomixin.AioMixin):
     def __init__(self, *,
                  api_version=None,
                  url=None,
@@ -35,7 +36,20 @@ class IotApi(mixin.AioMixin):
                  access_key=None,
                  customerid=None,
                  verify=None,
-                 timeout=None):
+                 timeout=None,
+                 rate_limiter=None,
+                 max_retries=None,
+                 retry_deadline=None,
+                 pool_size=None,
+                 pool_size_per_host=None,
+                 keepalive_timeout=None,
+                 dns_cache_ttl=None,
+                 tcp_nodelay=None,
+                 connector=None,
+                 json_codec=None,
+                 device_details_cache=None,
+                 coalesce=False,
+                 http_cache=None):
         self._log = logging.getLogger(__name__).log
         self._log(DEBUG2, 'pan-iot-security-python: %s, IotApi: %s',
                   __version__, api_version)
@@ -59,46 +73,164 @@ class IotApi(mixin.AioMixin):
                   self.ssl.check_hostname)
         auth = self._auth(access_key_id, access_key)
         self.jwt = access_key
+        self.rate_limiter = self._rate_limiter(rate_limiter)
+        self.json_codec = self._json_codec(json_codec)
+        self.device_details_cache = self._cache('device_details_cache',
+                                                device_details_cache)
+        self.coalesce = coalesce
+        self.http_cache = self._http_cache(http_cache)
+        # in-flight coalesced requests: {key: future}
+        self._inflight = {}
+        self._retry_options(max_retries, retry_deadline)
+        pool = self._pool_options(pool_size=pool_size,
+                                  pool_size_per_host=pool_size_per_host,
+                                  keepalive_timeout=keepalive_timeout,
+                                  dns_cache_ttl=dns_cache_ttl,
+                                  tcp_nodelay=tcp_nodelay)
         timeout_ = self._timeout(timeout)
         self._log(DEBUG2, 'timeout: %s', timeout_)
-        self.session = self._session(auth=auth, timeout=timeout_)
+        # a connector argument can be shared with other sessions
+        connector_owner = connector is None
+        connector = self._connector(pool, connector)
+        self.session = self._session(auth=auth,
+                                     timeout=timeout_,
+                                     connector=connector,
+                                     connector_owner=connector_owner)
         self._method_attributes()
 
     async def _request_retry(self, *,
                              retry=False,
                              method=None,
-                             retry_timeout=False,
                              func=None,
                              **kwargs):
         if retry:
             assert method is not None, 'method required when retry'
-            rate_limit_delay = method.window / method.rate_limit
-        if retry_timeout:
-            timeout_delay = 5
-            timeout_retries = 3
+            retry_ = self._retry(method)
 
         while True:
+            delay = self._rate_limit_delay(method)
+            if delay > 0:
+                await asyncio.sleep(delay)
             try:
                 resp = await func(**kwargs)
-            except asyncio.TimeoutError:
-                if not (retry_timeout and timeout_retries):
+            except aiohttp.ClientSSLError:
+                raise
+            except (asyncio.TimeoutError,
+                    aiohttp.ClientConnectionError) as e:
+                delay = retry_.delay(transient=True) if retry else None
+                if delay is None:
                     raise
-                self._log(DEBUG2, 'timeout, sleep %.2fs', timeout_delay)
-                await asyncio.sleep(timeout_delay)
-                timeout_delay *= 2
-                timeout_retries -= 1
+                self._log(DEBUG2, '%s, sleep %.2fs',
+                          e.__class__.__name__, delay)
+                await asyncio.sleep(delay)
             else:
-                if retry and resp.status == 429:
-                    self._log(DEBUG2, 'status code 429, sleep %.2fs',
-                              rate_limit_delay)
-                    await asyncio.sleep(rate_limit_delay)
-                    if rate_limit_delay < method.window / 4:
-                        rate_limit_delay *= 2
+                if retry and resp.status in mixin.RETRY_STATUS:
+                    delay = retry_.delay(headers=resp.headers,
+                                         transient=resp.status != 429)
+                    if delay is None:
+                        break
+                    self._log(DEBUG2, 'status code %d, sleep %.2fs',
+                              resp.status, delay)
+                    resp.release()
+                    await asyncio.sleep(delay)
                 else:
                     break
 
         return resp
 
+    async def _request_coalesce(self, *,
+                                retry=False,
+                                method=None,
+                                func=None,
+                                **kwargs):
+        # Concurrent identical requests share one request, and the
+        # response with its body read.
+        key = None
+        if self.coalesce:
+            key = self._cache_key(kwargs['url'], kwargs['params'])
+        if key is None:
+            return await self._request_retry(retry=retry,
+                                             method=method,
+                                             func=func,
+                                             **kwargs)
+
+        key = (retry, key)
+        while key in self._inflight:
+            future = self._inflight[key]
+            self._log(DEBUG2, '%s coalesced', method.__name__)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # request cancelled: send it
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            resp = await self._request_retry(retry=retry,
+                                             method=method,
+                                             func=func,
+                                             **kwargs)
+            await resp.read()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # don't log an exception with no waiters as not retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(resp)
+        finally:
+            del self._inflight[key]
+
+        return resp
+
+    async def _request_cached(self, *,
+                              request=None,
+                              retry=False,
+                              method=None,
+                              func=None,
+                              **kwargs):
+        if request is None:
+            request = self._request_retry
+        cache = self.http_cache
+        # Pages are not cached: pages cached at different times can
+        # duplicate or drop items in a get all.
+        if cache is None or 'offset' in kwargs['params']:
+            return await request(retry=retry,
+                                 method=method,
+                                 func=func,
+                                 **kwargs)
+
+        url, params = kwargs['url'], kwargs['params']
+        entry = cache.get(url, params)
+        if entry is not None:
+            if cache.fresh(entry):
+                self._log(DEBUG2, '%s http cache hit', method.__name__)
+                return aiomixin._CachedResponse(url, entry)
+            kwargs['headers'] = cache.validators(entry)
+
+        resp = await request(retry=retry,
+                             method=method,
+                             func=func,
+                             **kwargs)
+
+        if entry is not None and resp.status == 304:
+            self._log(DEBUG2, '%s http cache revalidated', method.__name__)
+            resp.release()
+            entry = cache.revalidated(url, params, entry, resp.headers)
+            return aiomixin._CachedResponse(url, entry)
+        if resp.status == 200:
+            body = await resp.read()
+            entry = cache.put(url, params, resp.status, resp.reason,
+                              resp.headers, body)
+            return aiomixin._CachedResponse(url, entry)
+
+        return resp
+
     async def device(self, *,
                      stime=None,
                      detail=False,
@@ -134,46 +266,211 @@ class IotApi(mixin.AioMixin):
 
         return resp
 
-    async def _get_all(self, func, keys, **kwargs):
+    async def _get_page(self, func, keys, offset, pagelength, **kwargs):
         def _get(x, keys):
             if not keys:
                 return x
             return _get(x[keys[0]], keys[1:])
 
+        start = time.monotonic()
+        resp = await func(offset=offset,
+                          pagelength=pagelength,
+                          retry=True,
+                          **kwargs)
+        if resp.status != 200:
+            return resp, None
+
+        obj = await resp.json(content_type=None,
+                              loads=self.json_codec.loads)
+        total = obj.get('total') if isinstance(obj, dict) else None
+        try:
+            obj = _get(obj, keys)
+        except KeyError as e:
+            raise ApiError('Malformed response, missing key %s' % e)
+        self._log(DEBUG2, 'offset %d length %d', offset, len(obj))
+
+        return resp, Page(obj, offset, total, time.monotonic() - start)
+
+    async def _get_page_items(self, func, keys, offset, pagelength,
+                              **kwargs):
+        # Yield (ok, x) for the page, parsing items from the response
+        # body as it is read.  The item count is yielded last as
+        # (None, length).
+        resp = await func(offset=offset,
+                          pagelength=pagelength,
+                          retry=True,
+                          **kwargs)
+        if resp.status != 200:
+            yield False, resp
+            return
+
+        parser = jsonstream.ArrayParser(keys)
+        length = 0
+        try:
+            async for chunk in resp.content.iter_chunked(
+                    jsonstream.CHUNK_SIZE):
+                for x in parser.feed(chunk):
+                    length += 1
+                    yield True, x
+            for x in parser.close():
+                length += 1
+                yield True, x
+        except KeyError as e:
+            raise ApiError('Malformed response, missing key %s' % e)
+        finally:
+            resp.release()
+        self._log(DEBUG2, 'offset %d length %d', offset, length)
+
+        yield None, length
+
+    async def _get_all_incremental(self, func, keys, **kwargs):
         offset = 0
         pagelength = 1000
 
         while True:
-            resp = await func(offset=offset,
-                              pagelength=pagelength,
-                              retry=True,
-                              **kwargs)
-            if resp.status == 200:
-                obj = await resp.json(content_type=None)
-                try:
-                    obj = _get(obj, keys)
-                except KeyError as e:
-                    raise ApiError('Malformed response, missing key %s' % e)
-                length = len(obj)
-                self._log(DEBUG2, 'length %d', length)
-                for x in obj:
-                    yield True, x
+            length = None
+            async for ok, x in self._get_page_items(func, keys,
+                                                    offset, pagelength,
+                                                    **kwargs):
+                if ok is None:
+                    length = x
+                else:
+                    yield ok, x
+            if length is None:
+                continue
+
+            if length < pagelength:
+                self._log(DEBUG1, 'total %d', offset + length)
+                break
+            offset += length
+
+    async def _get_all(self, func, keys,
+                       concurrency=None,
+                       ordered=True,
+                       incremental=False,
+                       **kwargs):
+        if incremental:
+            if concurrency is not None and concurrency > 1:
+                raise ArgsError('incremental and concurrency cannot be '
+                                'used together')
+            async for x in self._get_all_incremental(func, keys, **kwargs):
+                yield x
+            return
+
+        pages = self._get_pages(func, keys,
+                                concurrency=concurrency,
+                                ordered=ordered,
+                                **kwargs)
+        try:
+            async for ok, x in pages:
+                if not ok:
+                    yield False, x
+                    continue
+                for item in x.items:
+                    yield True, item
+        finally:
+            await pages.aclose()
+
+    async def _get_pages(self, func, keys,
+                         concurrency=None,
+                         ordered=True,
+                         **kwargs):
+        offset = 0
+        pagelength = 1000
+        fanout = concurrency is not None and concurrency > 1
 
+        while True:
+            resp, page = await self._get_page(func, keys,
+                                              offset, pagelength,
+                                              **kwargs)
+            if page is None:
+                yield False, resp
+                continue
+
+            length = len(page.items)
+            yield True, page
+
+            if length < pagelength:
+                self._log(DEBUG1, 'total %d', offset + length)
+                break
+            offset += length
+
+            if (fanout and isinstance(page.total, int) and
+                    page.total > offset):
+                # Fetch the remaining pages with a bounded number of
+                # requests in flight, then resume serially in case
+                # items were added after the first page.
+                fanout = False
+                offsets = range(offset, page.total, pagelength)
+                pages = self._get_fanout(func, keys, offsets, pagelength,
+                                         concurrency, ordered, **kwargs)
+                try:
+                    async for offset, resp, page in pages:
+                        while page is None:
+                            yield False, resp
+                            resp, page = await self._get_page(
+                                func, keys, offset, pagelength, **kwargs)
+                        yield True, page
+                        if offset == offsets[-1]:
+                            length = len(page.items)
+                finally:
+                    await pages.aclose()
+
+                offset = offsets[-1]
                 if length < pagelength:
                     self._log(DEBUG1, 'total %d', offset + length)
                     break
                 offset += length
-            else:
-                yield False, resp
+
+    async def _get_fanout(self, func, keys, offsets, pagelength,
+                          concurrency, ordered, **kwargs):
+        def fetch(offset):
+            coro = self._get_page(func, keys, offset, pagelength, **kwargs)
+            return asyncio.ensure_future(coro)
+
+        self._log(DEBUG1, 'fanout %d pages, concurrency %d',
+                  len(offsets), concurrency)
+        todo = iter(offsets)
+        pending = {}
+
+        try:
+            while True:
+                for offset in todo:
+                    pending[fetch(offset)] = offset
+                    if len(pending) >= concurrency:
+                        break
+                if not pending:
+                    break
+
+                if ordered:
+                    done = [next(iter(pending))]
+                    await done[0]
+                else:
+                    done, _ = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    offset = pending.pop(task)
+                    resp, page = task.result()
+                    yield offset, resp, page
+        finally:
+            for task in pending:
+                task.cancel()
 
     async def devices_all(self, *,
                           stime=None,
                           detail=False,
-                          query_string=None):
+                          query_string=None,
+                          concurrency=None,
+                          ordered=True,
+                          incremental=False):
         kwargs = {
             'stime': stime,
             'detail': detail,
             'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+            'incremental': incremental,
         }
 
         async for x in self._get_all(func=self.device,
@@ -181,6 +478,25 @@ class IotApi(mixin.AioMixin):
                                      **kwargs):
             yield x
 
+    async def devices_pages(self, *,
+                            stime=None,
+                            detail=False,
+                            query_string=None,
+                            concurrency=None,
+                            ordered=True):
+        kwargs = {
+            'stime': stime,
+            'detail': detail,
+            'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+        }
+
+        async for x in self._get_pages(func=self.device,
+                                       keys=['devices'],
+                                       **kwargs):
+            yield x
+
     async def device_details(self, *,
                              deviceid=None,
                              ip=None,
@@ -210,10 +526,26 @@ class IotApi(mixin.AioMixin):
 
         kwargs['url'] = url
 
-        resp = await self._request_retry(retry=retry,
-                                         method=self.device_details,
-                                         func=self.session.get,
-                                         **kwargs)
+        cache = self.device_details_cache
+        key = None
+        if cache is not None:
+            key = self._cache_key(url, kwargs['params'])
+            if key is not None:
+                resp = cache.get(key)
+                if resp is not None:
+                    self._log(DEBUG2, 'device_details cache hit: %s %s',
+                              deviceid, ip)
+                    return resp
+
+        resp = await self._request_coalesce(retry=retry,
+                                            method=self.device_details,
+                                            func=self.session.get,
+                                            **kwargs)
+
+        if key is not None and resp.status in (200, 404):
+            # read the body so the response can be reused
+            await resp.read()
+            cache.put(key, resp, negative=resp.status == 404)
 
         return resp
 
@@ -260,11 +592,13 @@ class IotApi(mixin.AioMixin):
     async def vulnerabilities_all(self, *,
                                   groupby=None,
                                   stime=None,
-                                  query_string=None):
+                                  query_string=None,
+                                  incremental=False):
         kwargs = {
             'groupby': groupby,
             'stime': stime,
             'query_string': query_string,
+            'incremental': incremental,
         }
         keys = ['items']
         if groupby is None or groupby == 'vulnerability':
@@ -275,6 +609,24 @@ class IotApi(mixin.AioMixin):
                                      **kwargs):
             yield x
 
+    async def vulnerabilities_pages(self, *,
+                                    groupby=None,
+                                    stime=None,
+                                    query_string=None):
+        kwargs = {
+            'groupby': groupby,
+            'stime': stime,
+            'query_string': query_string,
+        }
+        keys = ['items']
+        if groupby is None or groupby == 'vulnerability':
+            keys.append('items')
+
+        async for x in self._get_pages(func=self.vulnerability,
+                                       keys=keys,
+                                       **kwargs):
+            yield x
+
     async def alert(self, *,
                     stime=None,
                     offset=None,
@@ -309,10 +661,16 @@ class IotApi(mixin.AioMixin):
 
     async def alerts_all(self, *,
                          stime=None,
-                         query_string=None):
+                         query_string=None,
+                         concurrency=None,
+                         ordered=True,
+                         incremental=False):
         kwargs = {
             'stime': stime,
             'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+            'incremental': incremental,
         }
 
         async for x in self._get_all(func=self.alert,
@@ -320,6 +678,23 @@ class IotApi(mixin.AioMixin):
                                      **kwargs):
             yield x
 
+    async def alerts_pages(self, *,
+                           stime=None,
+                           query_string=None,
+                           concurrency=None,
+                           ordered=True):
+        kwargs = {
+            'stime': stime,
+            'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+        }
+
+        async for x in self._get_pages(func=self.alert,
+                                       keys=['items'],
+                                       **kwargs):
+            yield x
+
     async def tag(self, *,
                   offset=None,
                   pagelength=None,
@@ -345,10 +720,10 @@ class IotApi(mixin.AioMixin):
             'params': params,
         }
 
-        resp = await self._request_retry(retry=retry,
-                                         method=self.tag,
-                                         func=self.session.get,
-                                         **kwargs)
+        resp = await self._request_cached(retry=retry,
+                                          method=self.tag,
+                                          func=self.session.get,
+                                          **kwargs)
 
         return resp
 
@@ -370,10 +745,11 @@ class IotApi(mixin.AioMixin):
             'params': params,
         }
 
-        resp = await self._request_retry(retry=retry,
-                                         method=self.tag,
-                                         func=self.session.get,
-                                         **kwargs)
+        resp = await self._request_cached(request=self._request_coalesce,
+                                          retry=retry,
+                                          method=self.profile,
+                                          func=self.session.get,
+                                          **kwargs)
 
         return resp
 
@@ -401,17 +777,23 @@ class IotApi(mixin.AioMixin):
             'params': params,
         }
 
-        resp = await self._request_retry(retry=retry,
-                                         method=self.tag,
-                                         func=self.session.get,
-                                         **kwargs)
+        resp = await self._request_cached(retry=retry,
+                                          method=self.policy,
+                                          func=self.session.get,
+                                          **kwargs)
 
         return resp
 
     async def policies_all(self, *,
-                           query_string=None):
+                           query_string=None,
+                           concurrency=None,
+                           ordered=True,
+                           incremental=False):
         kwargs = {
             'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+            'incremental': incremental,
         }
 
         async for x in self._get_all(func=self.policy,
@@ -419,6 +801,21 @@ class IotApi(mixin.AioMixin):
                                      **kwargs):
             yield x
 
+    async def policies_pages(self, *,
+                             query_string=None,
+                             concurrency=None,
+                             ordered=True):
+        kwargs = {
+            'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+        }
+
+        async for x in self._get_pages(func=self.policy,
+                                       keys=['policies'],
+                                       **kwargs):
+            yield x
+
     async def device_update(self, *,
                             json=None,
                             query_string=None,
@@ -440,9 +837,9 @@ class IotApi(mixin.AioMixin):
         if json is not None:
             if isinstance(json, (bytes, str, bytearray)):
                 kwargs['data'] = json
-                kwargs['headers'] = {'content-type': 'application/json'}
             else:
-                kwargs['json'] = json
+                kwargs['data'] = self.json_codec.dumps(json)
+            kwargs['headers'] = {'content-type': 'application/json'}
 
         resp = await self._request_retry(retry=retry,
                                          method=self.device_update,
@@ -472,9 +869,9 @@ class IotApi(mixin.AioMixin):
         if json is not None:
             if isinstance(json, (bytes, str, bytearray)):
                 kwargs['data'] = json
-                kwargs['headers'] = {'content-type': 'application/json'}
             else:
-                kwargs['json'] = json
+                kwargs['data'] = self.json_codec.dumps(json)
+            kwargs['headers'] = {'content-type': 'application/json'}
 
         resp = await self._request_retry(retry=retry,
                                          method=self.vuln_update,
@@ -507,9 +904,9 @@ class IotApi(mixin.AioMixin):
         if json is not None:
             if isinstance(json, (bytes, str, bytearray)):
                 kwargs['data'] = json
-                kwargs['headers'] = {'content-type': 'application/json'}
             else:
-                kwargs['json'] = json
+                kwargs['data'] = self.json_codec.dumps(json)
+            kwargs['headers'] = {'content-type': 'application/json'}
 
         resp = await self._request_retry(retry=retry,
                                          method=self.alert_update,
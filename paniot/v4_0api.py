@@ -14,20 +14,22 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
+import concurrent.futures
 import logging
 import requests
+import requests.adapters
 import ssl
 import sys
 import time
 
-from . import (mixin, ApiError, ArgsError,
+from . import (jsonstream, mixin, requestsmixin, ApiError, ArgsError, Page,
                DEBUG1, DEBUG2, DEBUG3, __version__)
 
 
 BASE_PATH = '/pub/v4.0'
 
 
-class IotApi(mixin.Mixin):
+class IotApi(requestsmixin.Mixin):
     def __init__(self, *,
                  api_version=None,
                  url=None,
@@ -35,7 +37,18 @@ class IotApi(mixin.Mixin):
                  access_key=None,
                  customerid=None,
                  verify=None,
-                 timeout=None):
+                 timeout=None,
+                 rate_limiter=None,
+                 max_retries=None,
+                 retry_deadline=None,
+                 pool_size=None,
+                 pool_size_per_host=None,
+                 keepalive_timeout=None,
+                 dns_cache_ttl=None,
+                 tcp_nodelay=None,
+                 json_codec=None,
+                 device_details_cache=None,
+                 http_cache=None):
         self._log = logging.getLogger(__name__).log
         self._log(DEBUG2, 'pan-iot-security-python: %s, IotApi: %s',
                   __version__, api_version)
@@ -53,53 +66,117 @@ class IotApi(mixin.Mixin):
             self.url = url
         auth = self._auth(access_key_id, access_key)
         self.jwt = access_key
+        self.rate_limiter = self._rate_limiter(rate_limiter)
+        self.json_codec = self._json_codec(json_codec)
+        self.device_details_cache = self._cache('device_details_cache',
+                                                device_details_cache)
+        self.http_cache = self._http_cache(http_cache)
+        self._retry_options(max_retries, retry_deadline)
+        pool = self._pool_options(pool_size=pool_size,
+                                  pool_size_per_host=pool_size_per_host,
+                                  keepalive_timeout=keepalive_timeout,
+                                  dns_cache_ttl=dns_cache_ttl,
+                                  tcp_nodelay=tcp_nodelay)
         self.session = self._session(auth=auth,
                                      verify=verify,
-                                     timeout=timeout)
+                                     timeout=timeout,
+                                     pool=pool)
         self._method_attributes()
 
     def _request_retry(self, *,
                        retry=False,
                        method=None,
-                       retry_timeout=False,
                        func=None,
+                       stream=False,
                        **kwargs):
         if retry:
             assert method is not None, 'method required when retry'
-            rate_limit_delay = method.window / method.rate_limit
-        if retry_timeout:
-            timeout_delay = 5
-            timeout_retries = 3
+            retry_ = self._retry(method)
+
+        if stream:
+            # body is read by the caller
+            kwargs['stream'] = True
 
         while True:
+            delay = self._rate_limit_delay(method)
+            if delay > 0:
+                time.sleep(delay)
             try:
                 resp = func(**kwargs)
-            except requests.Timeout:
-                if not (retry_timeout and timeout_retries):
+            except requests.exceptions.SSLError:
+                raise
+            except (requests.Timeout,
+                    requests.ConnectionError) as e:
+                delay = retry_.delay(transient=True) if retry else None
+                if delay is None:
                     raise
-                self._log(DEBUG2, 'timeout, sleep %.2fs', timeout_delay)
-                time.sleep(timeout_delay)
-                timeout_delay *= 2
-                timeout_retries -= 1
+                self._log(DEBUG2, '%s, sleep %.2fs',
+                          e.__class__.__name__, delay)
+                time.sleep(delay)
             else:
-                if retry and resp.status_code == 429:
-                    self._log(DEBUG2, 'status code 429, sleep %.2fs',
-                              rate_limit_delay)
-                    time.sleep(rate_limit_delay)
-                    if rate_limit_delay < method.window / 4:
-                        rate_limit_delay *= 2
+                if retry and resp.status_code in mixin.RETRY_STATUS:
+                    delay = retry_.delay(headers=resp.headers,
+                                         transient=resp.status_code != 429)
+                    if delay is None:
+                        break
+                    self._log(DEBUG2, 'status code %d, sleep %.2fs',
+                              resp.status_code, delay)
+                    resp.close()
+                    time.sleep(delay)
                 else:
                     break
 
         return resp
 
+    def _request_cached(self, *,
+                        retry=False,
+                        method=None,
+                        func=None,
+                        stream=False,
+                        **kwargs):
+        cache = self.http_cache
+        # Pages are not cached: pages cached at different times can
+        # duplicate or drop items in a get all.
+        if cache is None or 'offset' in kwargs['params']:
+            return self._request_retry(retry=retry,
+                                       method=method,
+                                       func=func,
+                                       stream=stream,
+                                       **kwargs)
+
+        url, params = kwargs['url'], kwargs['params']
+        entry = cache.get(url, params)
+        if entry is not None:
+            if cache.fresh(entry):
+                self._log(DEBUG2, '%s http cache hit', method.__name__)
+                return requestsmixin._cached_response(url, entry)
+            kwargs['headers'] = cache.validators(entry)
+
+        resp = self._request_retry(retry=retry,
+                                   method=method,
+                                   func=func,
+                                   stream=stream,
+                                   **kwargs)
+
+        if entry is not None and resp.status_code == 304:
+            self._log(DEBUG2, '%s http cache revalidated', method.__name__)
+            resp.close()
+            entry = cache.revalidated(url, params, entry, resp.headers)
+            return requestsmixin._cached_response(url, entry)
+        if resp.status_code == 200:
+            cache.put(url, params, resp.status_code, resp.reason,
+                      resp.headers, resp.content)
+
+        return resp
+
     def device(self, *,
                stime=None,
                detail=False,
                offset=None,
                pagelength=None,
                query_string=None,
-               retry=False):
+               retry=False,
+               stream=False):
         path = BASE_PATH + '/device/list'
         url = self.url + path
 
@@ -123,50 +200,226 @@ class IotApi(mixin.Mixin):
         resp = self._request_retry(retry=retry,
                                    method=self.device,
                                    func=self.session.get,
+                                   stream=stream,
                                    **kwargs)
 
         return resp
 
-    def _get_all(self, func, keys, **kwargs):
+    def _get_page(self, func, keys, offset, pagelength, **kwargs):
         def _get(x, keys):
             if not keys:
                 return x
             return _get(x[keys[0]], keys[1:])
 
+        start = time.monotonic()
+        resp = func(offset=offset,
+                    pagelength=pagelength,
+                    retry=True,
+                    **kwargs)
+        if resp.status_code != 200:
+            return resp, None
+
+        obj = self.json_codec.loads(resp.content)
+        total = obj.get('total') if isinstance(obj, dict) else None
+        try:
+            obj = _get(obj, keys)
+        except KeyError as e:
+            raise ApiError('Malformed response, missing key %s' % e)
+        self._log(DEBUG2, 'offset %d length %d', offset, len(obj))
+
+        return resp, Page(obj, offset, total, time.monotonic() - start)
+
+    def _get_page_items(self, func, keys, offset, pagelength, **kwargs):
+        # Yield (ok, x) for the page, parsing items from the response
+        # body as it is read.  The item count is yielded last as
+        # (None, length).
+        resp = func(offset=offset,
+                    pagelength=pagelength,
+                    retry=True,
+                    stream=True,
+                    **kwargs)
+        if resp.status_code != 200:
+            yield False, resp
+            return
+
+        parser = jsonstream.ArrayParser(keys)
+        length = 0
+        try:
+            for chunk in resp.iter_content(jsonstream.CHUNK_SIZE):
+                for x in parser.feed(chunk):
+                    length += 1
+                    yield True, x
+            for x in parser.close():
+                length += 1
+                yield True, x
+        except KeyError as e:
+            raise ApiError('Malformed response, missing key %s' % e)
+        finally:
+            resp.close()
+        self._log(DEBUG2, 'offset %d length %d', offset, length)
+
+        yield None, length
+
+    def _get_all_incremental(self, func, keys, **kwargs):
         offset = 0
         pagelength = 1000
 
         while True:
-            resp = func(offset=offset,
-                        pagelength=pagelength,
-                        retry=True,
-                        **kwargs)
-            if resp.status_code == 200:
-                obj = resp.json()
-                try:
-                    obj = _get(obj, keys)
-                except KeyError as e:
-                    raise ApiError('Malformed response, missing key %s' % e)
-                length = len(obj)
-                self._log(DEBUG2, 'length %d', length)
-                for x in obj:
-                    yield True, x
+            length = None
+            for ok, x in self._get_page_items(func, keys,
+                                              offset, pagelength,
+                                              **kwargs):
+                if ok is None:
+                    length = x
+                else:
+                    yield ok, x
+            if length is None:
+                continue
+
+            if length < pagelength:
+                self._log(DEBUG1, 'total %d', offset + length)
+                break
+            offset += length
+
+    def _get_all(self, func, keys,
+                 concurrency=None,
+                 ordered=True,
+                 incremental=False,
+                 **kwargs):
+        if incremental:
+            if concurrency is not None and concurrency > 1:
+                raise ArgsError('incremental and concurrency cannot be '
+                                'used together')
+            yield from self._get_all_incremental(func, keys, **kwargs)
+            return
+
+        pages = self._get_pages(func, keys,
+                                concurrency=concurrency,
+                                ordered=ordered,
+                                **kwargs)
+        try:
+            for ok, x in pages:
+                if not ok:
+                    yield False, x
+                    continue
+                for item in x.items:
+                    yield True, item
+        finally:
+            pages.close()
+
+    def _get_pages(self, func, keys,
+                   concurrency=None,
+                   ordered=True,
+                   **kwargs):
+        offset = 0
+        pagelength = 1000
+        fanout = concurrency is not None and concurrency > 1
 
+        while True:
+            resp, page = self._get_page(func, keys,
+                                        offset, pagelength,
+                                        **kwargs)
+            if page is None:
+                yield False, resp
+                continue
+
+            length = len(page.items)
+            yield True, page
+
+            if length < pagelength:
+                self._log(DEBUG1, 'total %d', offset + length)
+                break
+            offset += length
+
+            if (fanout and isinstance(page.total, int) and
+                    page.total > offset):
+                # Fetch the remaining pages with a bounded number of
+                # requests in flight, then resume serially in case
+                # items were added after the first page.
+                fanout = False
+                offsets = range(offset, page.total, pagelength)
+                pages = self._get_fanout(func, keys, offsets, pagelength,
+                                         concurrency, ordered, **kwargs)
+                try:
+                    for offset, resp, page in pages:
+                        while page is None:
+                            yield False, resp
+                            resp, page = self._get_page(
+                                func, keys, offset, pagelength, **kwargs)
+                        yield True, page
+                        if offset == offsets[-1]:
+                            length = len(page.items)
+                finally:
+                    pages.close()
+
+                offset = offsets[-1]
                 if length < pagelength:
                     self._log(DEBUG1, 'total %d', offset + length)
                     break
                 offset += length
-            else:
-                yield False, resp
+
+    def _get_fanout(self, func, keys, offsets, pagelength,
+                    concurrency, ordered, **kwargs):
+        # requests.Session is shared by the worker threads; limit the
+        # workers to the connection pool size so they don't block
+        # waiting for (or discard) pooled connections.
+        adapter = self.session.get_adapter(self.url)
+        pool_maxsize = getattr(adapter, '_pool_maxsize',
+                               requests.adapters.DEFAULT_POOLSIZE)
+        if concurrency > pool_maxsize:
+            self._log(DEBUG1, 'concurrency %d > pool size %d',
+                      concurrency, pool_maxsize)
+            concurrency = pool_maxsize
+
+        self._log(DEBUG1, 'fanout %d pages, concurrency %d',
+                  len(offsets), concurrency)
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency)
+        todo = iter(offsets)
+        pending = {}
+
+        try:
+            while True:
+                for offset in todo:
+                    future = executor.submit(self._get_page, func, keys,
+                                             offset, pagelength, **kwargs)
+                    pending[future] = offset
+                    if len(pending) >= concurrency:
+                        break
+                if not pending:
+                    break
+
+                if ordered:
+                    done = [next(iter(pending))]
+                    concurrent.futures.wait(done)
+                else:
+                    done, _ = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    offset = pending.pop(future)
+                    resp, page = future.result()
+                    yield offset, resp, page
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def devices_all(self, *,
                     stime=None,
                     detail=False,
-                    query_string=None):
+                    query_string=None,
+                    concurrency=None,
+                    ordered=True,
+                    incremental=False):
         kwargs = {
             'stime': stime,
             'detail': detail,
             'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+            'incremental': incremental,
         }
 
         for x in self._get_all(func=self.device,
@@ -174,6 +427,25 @@ class IotApi(mixin.Mixin):
                                **kwargs):
             yield x
 
+    def devices_pages(self, *,
+                      stime=None,
+                      detail=False,
+                      query_string=None,
+                      concurrency=None,
+                      ordered=True):
+        kwargs = {
+            'stime': stime,
+            'detail': detail,
+            'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+        }
+
+        for x in self._get_pages(func=self.device,
+                                 keys=['devices'],
+                                 **kwargs):
+            yield x
+
     def device_details(self, *,
                        deviceid=None,
                        ip=None,
@@ -202,11 +474,25 @@ class IotApi(mixin.Mixin):
 
         kwargs['url'] = url
 
+        cache = self.device_details_cache
+        key = None
+        if cache is not None:
+            key = self._cache_key(url, kwargs['params'])
+            if key is not None:
+                resp = cache.get(key)
+                if resp is not None:
+                    self._log(DEBUG2, 'device_details cache hit: %s %s',
+                              deviceid, ip)
+                    return resp
+
         resp = self._request_retry(retry=retry,
                                    method=self.device_details,
                                    func=self.session.get,
                                    **kwargs)
 
+        if key is not None and resp.status_code in (200, 404):
+            cache.put(key, resp, negative=resp.status_code == 404)
+
         return resp
 
     def vulnerability(self, *,
@@ -216,7 +502,8 @@ class IotApi(mixin.Mixin):
                       offset=None,
                       pagelength=None,
                       query_string=None,
-                      retry=False):
+                      retry=False,
+                      stream=False):
         path = BASE_PATH + '/vulnerability/list'
         url = self.url + path
 
@@ -244,6 +531,7 @@ class IotApi(mixin.Mixin):
         resp = self._request_retry(retry=retry,
                                    method=self.vulnerability,
                                    func=self.session.get,
+                                   stream=stream,
                                    **kwargs)
 
         return resp
@@ -251,11 +539,13 @@ class IotApi(mixin.Mixin):
     def vulnerabilities_all(self, *,
                             groupby=None,
                             stime=None,
-                            query_string=None):
+                            query_string=None,
+                            incremental=False):
         kwargs = {
             'groupby': groupby,
             'stime': stime,
             'query_string': query_string,
+            'incremental': incremental,
         }
         keys = ['items']
         if groupby is None or groupby == 'vulnerability':
@@ -266,12 +556,31 @@ class IotApi(mixin.Mixin):
                                **kwargs):
             yield x
 
+    def vulnerabilities_pages(self, *,
+                              groupby=None,
+                              stime=None,
+                              query_string=None):
+        kwargs = {
+            'groupby': groupby,
+            'stime': stime,
+            'query_string': query_string,
+        }
+        keys = ['items']
+        if groupby is None or groupby == 'vulnerability':
+            keys.append('items')
+
+        for x in self._get_pages(func=self.vulnerability,
+                                 keys=keys,
+                                 **kwargs):
+            yield x
+
     def alert(self, *,
               stime=None,
               offset=None,
               pagelength=None,
               query_string=None,
-              retry=False):
+              retry=False,
+              stream=False):
         path = BASE_PATH + '/alert/list'
         url = self.url + path
 
@@ -293,16 +602,23 @@ class IotApi(mixin.Mixin):
         resp = self._request_retry(retry=retry,
                                    method=self.alert,
                                    func=self.session.get,
+                                   stream=stream,
                                    **kwargs)
 
         return resp
 
     def alerts_all(self, *,
                    stime=None,
-                   query_string=None):
+                   query_string=None,
+                   concurrency=None,
+                   ordered=True,
+                   incremental=False):
         kwargs = {
             'stime': stime,
             'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+            'incremental': incremental,
         }
 
         for x in self._get_all(func=self.alert,
@@ -310,6 +626,23 @@ class IotApi(mixin.Mixin):
                                **kwargs):
             yield x
 
+    def alerts_pages(self, *,
+                     stime=None,
+                     query_string=None,
+                     concurrency=None,
+                     ordered=True):
+        kwargs = {
+            'stime': stime,
+            'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+        }
+
+        for x in self._get_pages(func=self.alert,
+                                 keys=['items'],
+                                 **kwargs):
+            yield x
+
     def tag(self, *,
             offset=None,
             pagelength=None,
@@ -334,10 +667,10 @@ class IotApi(mixin.Mixin):
             'params': params,
         }
 
-        resp = self._request_retry(retry=retry,
-                                   method=self.tag,
-                                   func=self.session.get,
-                                   **kwargs)
+        resp = self._request_cached(retry=retry,
+                                    method=self.tag,
+                                    func=self.session.get,
+                                    **kwargs)
 
         return resp
 
@@ -358,10 +691,10 @@ class IotApi(mixin.Mixin):
             'params': params,
         }
 
-        resp = self._request_retry(retry=retry,
-                                   method=self.tag,
-                                   func=self.session.get,
-                                   **kwargs)
+        resp = self._request_cached(retry=retry,
+                                    method=self.profile,
+                                    func=self.session.get,
+                                    **kwargs)
 
         return resp
 
@@ -369,7 +702,8 @@ class IotApi(mixin.Mixin):
                offset=None,
                pagelength=None,
                query_string=None,
-               retry=False):
+               retry=False,
+               stream=False):
         path = BASE_PATH + '/policy/recommendation'
         url = self.url + path
 
@@ -388,17 +722,24 @@ class IotApi(mixin.Mixin):
             'params': params,
         }
 
-        resp = self._request_retry(retry=retry,
-                                   method=self.tag,
-                                   func=self.session.get,
-                                   **kwargs)
+        resp = self._request_cached(retry=retry,
+                                    method=self.policy,
+                                    func=self.session.get,
+                                    stream=stream,
+                                    **kwargs)
 
         return resp
 
     def policies_all(self, *,
-                     query_string=None):
+                     query_string=None,
+                     concurrency=None,
+                     ordered=True,
+                     incremental=False):
         kwargs = {
             'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+            'incremental': incremental,
         }
 
         for x in self._get_all(func=self.policy,
@@ -406,6 +747,21 @@ class IotApi(mixin.Mixin):
                                **kwargs):
             yield x
 
+    def policies_pages(self, *,
+                       query_string=None,
+                       concurrency=None,
+                       ordered=True):
+        kwargs = {
+            'query_string': query_string,
+            'concurrency': concurrency,
+            'ordered': ordered,
+        }
+
+        for x in self._get_pages(func=self.policy,
+                                 keys=['policies'],
+                                 **kwargs):
+            yield x
+
     def device_update(self, *,
                       json=None,
                       query_string=None,
@@ -426,9 +782,9 @@ class IotApi(mixin.Mixin):
         if json is not None:
             if isinstance(json, (bytes, str, bytearray)):
                 kwargs['data'] = json
-                kwargs['headers'] = {'content-type': 'application/json'}
             else:
-                kwargs['json'] = json
+                kwargs['data'] = self.json_codec.dumps(json)
+            kwargs['headers'] = {'content-type': 'application/json'}
 
         resp = self._request_retry(retry=retry,
                                    method=self.device_update,
@@ -457,9 +813,9 @@ class IotApi(mixin.Mixin):
         if json is not None:
             if isinstance(json, (bytes, str, bytearray)):
                 kwargs['data'] = json
-                kwargs['headers'] = {'content-type': 'application/json'}
             else:
-                kwargs['json'] = json
+                kwargs['data'] = self.json_codec.dumps(json)
+            kwargs['headers'] = {'content-type': 'application/json'}
 
         resp = self._request_retry(retry=retry,
                                    method=self.vuln_update,
@@ -491,9 +847,9 @@ class IotApi(mixin.Mixin):
         if json is not None:
             if isinstance(json, (bytes, str, bytearray)):
                 kwargs['data'] = json
-                kwargs['headers'] = {'content-type': 'application/json'}
             else:
-                kwargs['json'] = json
+                kwargs['data'] = self.json_codec.dumps(json)
+            kwargs['headers'] = {'content-type': 'application/json'}
 
         resp = self._request_retry(retry=retry,
                                    method=self.alert_update,
@@ -1,3 +1,4 @@
+import aiohttp
 import asyncio
 import unittest
 
@@ -78,3 +79,59 @@ class IotApiTest(unittest.IsolatedAsyncioTestCase):
                   self.api.alert_update]:
             self.assertTrue(x.window > 0)
             self.assertTrue(x.rate_limit > 0)
+
+    async def test_07(self):
+        kwargs = {
+            'customerid': 'x',
+            'access_key_id': 'x',
+            'access_key': 'x',
+            'pool_size': 0,
+        }
+        with self.assertRaises(paniot.ArgsError) as e:
+            self.api = paniot.IotApi(**kwargs)
+        self.assertEqual(str(e.exception),
+                         'pool_size must be an integer > 0')
+
+    async def test_08(self):
+        kwargs = {
+            'customerid': 'x',
+            'access_key_id': 'x',
+            'access_key': 'x',
+            'pool_size': 50,
+            'pool_size_per_host': 20,
+            'keepalive_timeout': 60,
+            'dns_cache_ttl': 300,
+        }
+        self.api = paniot.IotApi(**kwargs)
+        self.assertEqual(self.api.session.connector.limit, 50)
+        self.assertEqual(self.api.session.connector.limit_per_host, 20)
+
+    async def test_09(self):
+        kwargs = {
+            'customerid': 'x',
+            'access_key_id': 'x',
+            'access_key': 'x',
+            'connector': aiohttp.TCPConnector(),
+        }
+        self.api = paniot.IotApi(**kwargs)
+        x = paniot.IotApi(**kwargs)
+        self.assertIs(self.api.session.connector, x.session.connector)
+        self.assertIs(self.api.ssl, x.ssl)
+        await x.session.close()
+        self.assertFalse(kwargs['connector'].closed)
+        await kwargs['connector'].close()
+
+    async def test_10(self):
+        kwargs = {
+            'customerid': 'x',
+            'access_key_id': 'x',
+            'access_key': 'x',
+            'connector': aiohttp.TCPConnector(),
+            'pool_size': 10,
+        }
+        with self.assertRaises(paniot.ArgsError) as e:
+            self.api = paniot.IotApi(**kwargs)
+        self.assertEqual(str(e.exception),
+                         'connector and connection pool options '
+                         'cannot be used at the same time')
+        await kwargs['connector'].close()
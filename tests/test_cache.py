@@ -0,0 +1,178 @@
+import io
+import json
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import requests
+
+import paniot
+import paniot.cache
+
+
+class TtlCache(paniot.cache.TtlCache):
+    def __init__(self, **kwargs):
+        self.now = 0.0
+        super().__init__(**kwargs)
+
+    def _time(self):
+        return self.now
+
+
+class TtlCacheTest(unittest.TestCase):
+    def test_01(self):
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.cache.TtlCache(maxsize=0)
+        self.assertEqual(str(e.exception), 'maxsize must be an integer > 0')
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.cache.TtlCache(negative_ttl=-1)
+        self.assertEqual(str(e.exception), 'negative_ttl must be >= 0')
+
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.IotApi(customerid='x', access_key_id='x',
+                          access_key='x', device_details_cache={})
+        self.assertEqual(str(e.exception),
+                         'device_details_cache not TtlCache')
+
+    def test_02(self):
+        x = TtlCache(ttl=10, negative_ttl=5)
+        self.assertIsNone(x.get('a'))
+        x.put('a', 1)
+        x.put('b', 2, negative=True)
+        self.assertEqual(x.get('a'), 1)
+        self.assertEqual(x.get('b'), 2)
+        x.now += 5
+        self.assertEqual(x.get('a'), 1)
+        self.assertIsNone(x.get('b'))
+        x.now += 5
+        self.assertIsNone(x.get('a'))
+        self.assertEqual(x.cache_info(),
+                         (3, 3, 1, 0, 10000, 0))
+
+        x = TtlCache(negative_ttl=0)
+        x.put('a', 1, negative=True)
+        self.assertIsNone(x.get('a'))
+
+    def test_03(self):
+        x = TtlCache(maxsize=2)
+        x.put('a', 1)
+        x.put('b', 2)
+        self.assertEqual(x.get('a'), 1)
+        x.put('c', 3)
+        # b is least recently used
+        self.assertIsNone(x.get('b'))
+        self.assertEqual(x.get('a'), 1)
+        self.assertEqual(x.get('c'), 3)
+        info = x.cache_info()
+        self.assertEqual(info.evictions, 1)
+        self.assertEqual(info.currsize, 2)
+
+        x.clear()
+        self.assertEqual(x.cache_info(), (0, 0, 0, 0, 2, 0))
+
+
+def device_details_response(params):
+    if params.get('ip') == '10.0.0.99':
+        return 404, {'error': 'not found'}
+    return 200, {'deviceid': 'd1', 'ip': params.get('ip')}
+
+
+class DeviceDetailsTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = TtlCache(ttl=300, negative_ttl=60)
+        self.api = paniot.IotApi(customerid='x', access_key_id='x',
+                                 access_key='x',
+                                 device_details_cache=self.cache)
+        self.calls = []
+
+        def get(**kwargs):
+            self.calls.append(kwargs['params'])
+            status, obj = device_details_response(kwargs['params'])
+            resp = requests.Response()
+            resp.status_code = status
+            resp.raw = io.BytesIO(json.dumps(obj).encode())
+            return resp
+
+        self.api.session.get = get
+
+    def tearDown(self):
+        self.api.session.close()
+
+    def test_01(self):
+        resp = self.api.device_details(ip='10.0.0.1')
+        self.assertEqual(resp.status_code, 200)
+        x = self.api.device_details(ip='10.0.0.1')
+        self.assertIs(x, resp)
+        self.assertEqual(x.json()['ip'], '10.0.0.1')
+        self.assertEqual(len(self.calls), 1)
+
+        self.api.device_details(deviceid='10.0.0.1')
+        self.assertEqual(len(self.calls), 2)
+
+        for _ in range(2):
+            resp = self.api.device_details(ip='10.0.0.99')
+            self.assertEqual(resp.status_code, 404)
+        self.assertEqual(len(self.calls), 3)
+        x = self.cache.cache_info()
+        self.assertEqual((x.hits, x.negative_hits), (2, 1))
+
+        # negative entries expire first
+        self.cache.now += 61
+        self.api.device_details(ip='10.0.0.99')
+        self.api.device_details(ip='10.0.0.1')
+        self.assertEqual(len(self.calls), 4)
+
+    def test_02(self):
+        # unhashable query string values are not cached
+        for _ in range(2):
+            self.api.device_details(ip='10.0.0.1',
+                                    query_string={'x': ['a']})
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.cache.cache_info().currsize, 0)
+
+
+class AioDeviceDetailsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = []
+
+        async def handler(request):
+            self.calls.append(dict(request.query))
+            status, obj = device_details_response(request.query)
+            return web.json_response(obj, status=status)
+
+        app = web.Application()
+        app.router.add_get('/pub/v4.0/device/ip', handler)
+        app.router.add_get('/pub/v4.0/device', handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.cache = TtlCache()
+        self.api = paniot.IotApi(customerid='x', access_key_id='x',
+                                 access_key='x',
+                                 url=str(self.server.make_url('')),
+                                 device_details_cache=self.cache)
+
+    async def asyncTearDown(self):
+        await self.api.session.close()
+        await self.server.close()
+
+    async def test_01(self):
+        resp = await self.api.device_details(ip='10.0.0.1')
+        self.assertEqual(resp.status, 200)
+        self.assertEqual((await resp.json())['ip'], '10.0.0.1')
+        # a second caller reads the cached response again
+        x = await self.api.device_details(ip='10.0.0.1')
+        self.assertIs(x, resp)
+        self.assertEqual((await x.json())['ip'], '10.0.0.1')
+        self.assertEqual(len(self.calls), 1)
+
+        for _ in range(2):
+            resp = await self.api.device_details(ip='10.0.0.99')
+            self.assertEqual(resp.status, 404)
+            self.assertEqual(await resp.json(), {'error': 'not found'})
+        self.assertEqual(len(self.calls), 2)
+        x = self.cache.cache_info()
+        self.assertEqual((x.hits, x.negative_hits), (2, 1))
+
+        self.cache.now += 301
+        await self.api.device_details(ip='10.0.0.1')
+        self.assertEqual(len(self.calls), 3)
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+import paniot
+
+
+class Response:
+    def __init__(self, status):
+        self.status = status
+
+    async def read(self):
+        pass
+
+
+class CoalesceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.api = paniot.IotApi(customerid='x', access_key_id='x',
+                                 access_key='x', coalesce=True)
+        self.calls = []
+
+        async def request_retry(**kwargs):
+            self.calls.append(kwargs['params'])
+            await asyncio.sleep(0.01)
+            if kwargs['params'].get('ip') == 'error':
+                raise paniot.ApiError('error')
+            return Response(200)
+
+        self.api._request_retry = request_retry
+
+    async def asyncTearDown(self):
+        await self.api.session.close()
+
+    async def test_01(self):
+        x = await asyncio.gather(
+            *[self.api.device_details(ip='1') for _ in range(10)],
+            *[self.api.device_details(deviceid='1') for _ in range(10)],
+            *[self.api.profile() for _ in range(10)])
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(len(set(map(id, x))), 3)
+        self.assertEqual(self.api._inflight, {})
+
+        await self.api.profile()
+        self.assertEqual(len(self.calls), 4)
+
+    async def test_02(self):
+        x = await asyncio.gather(
+            *[self.api.device_details(ip='error') for _ in range(5)],
+            return_exceptions=True)
+        self.assertEqual(len(self.calls), 1)
+        for e in x:
+            self.assertIsInstance(e, paniot.ApiError)
+
+    async def test_03(self):
+        leader = asyncio.ensure_future(self.api.device_details(ip='1'))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(self.api.device_details(ip='1'))
+        await asyncio.sleep(0)
+        leader.cancel()
+        resp = await waiter
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_04(self):
+        self.api.coalesce = False
+        await asyncio.gather(*[self.api.profile() for _ in range(3)])
+        self.assertEqual(len(self.calls), 3)
@@ -0,0 +1,234 @@
+import json
+import os
+import tempfile
+import unittest
+
+import multidict
+import requests
+
+import paniot
+import paniot.httpcache
+from paniot.jsonstream import ArrayParser
+
+BODY = b'{"policies": [{"name": "a"}, {"name": "b"}], "total": 2}'
+
+
+class HttpCache(paniot.httpcache.HttpCache):
+    def __init__(self, *args, **kwargs):
+        self.now = 1000.0
+        super().__init__(*args, **kwargs)
+
+    def _time(self):
+        return self.now
+
+
+class HttpCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'cache')
+        self.url = 'https://x.iot.paloaltonetworks.com/pub/v4.0/tag/list'
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_01(self):
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.httpcache.HttpCache(self.path, ttl=-1)
+        self.assertEqual(str(e.exception), 'ttl must be >= 0')
+
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.IotApi(customerid='x', access_key_id='x',
+                          access_key='x', http_cache=self.path)
+        self.assertEqual(str(e.exception), 'http_cache not HttpCache')
+
+    def test_02(self):
+        x = HttpCache(self.path, ttl=60)
+        params = {'customerid': 'x', 'offset': 0}
+        self.assertIsNone(x.get(self.url, params))
+        headers = {
+            'content-type': 'application/json',
+            'etag': '"1"',
+            'set-cookie': 'x',
+        }
+        x.put(self.url, params, 200, 'OK', headers, b'{"tags": []}\n')
+
+        # shared by instances
+        y = HttpCache(self.path, ttl=60)
+        y.now = x.now
+        entry = y.get(self.url, dict(reversed(list(params.items()))))
+        self.assertEqual(entry.status, 200)
+        self.assertEqual(entry.reason, 'OK')
+        self.assertEqual(entry.body, b'{"tags": []}\n')
+        self.assertEqual(entry.headers, {
+            'content-type': 'application/json',
+            'etag': '"1"',
+        })
+        self.assertTrue(y.fresh(entry))
+        self.assertIsNone(y.get(self.url, {'customerid': 'x'}))
+
+        y.now += 60
+        self.assertFalse(y.fresh(entry))
+        self.assertEqual(y.validators(entry), {'If-None-Match': '"1"'})
+        entry = y.revalidated(self.url, params, entry,
+                              {'etag': '"1"',
+                               'last-modified': 'Mon, 01 Jan 2024'})
+        self.assertTrue(y.fresh(entry))
+        self.assertEqual(y.validators(y.get(self.url, params)), {
+            'If-None-Match': '"1"',
+            'If-Modified-Since': 'Mon, 01 Jan 2024',
+        })
+        self.assertEqual(y.get(self.url, params).body, b'{"tags": []}\n')
+
+        y.clear()
+        self.assertIsNone(x.get(self.url, params))
+        self.assertEqual(os.listdir(self.path), [])
+
+
+class Server:
+    # policy responses with an ETag; a matching If-None-Match is 304
+    def __init__(self):
+        self.calls = []
+        self.etag = '"1"'
+
+    def response(self, kwargs):
+        headers = kwargs.get('headers', {})
+        self.calls.append((kwargs['params'], headers))
+        if headers.get('If-None-Match') == self.etag:
+            return 304, 'Not Modified', {'etag': self.etag}, b''
+        return 200, 'OK', {'content-type': 'application/json',
+                           'etag': self.etag}, BODY
+
+
+class AioResponse:
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = multidict.CIMultiDict(headers)
+        self.body = body
+
+    async def read(self):
+        return self.body
+
+    async def json(self, *, content_type=None, loads=json.loads):
+        return loads(self.body)
+
+    def release(self):
+        pass
+
+
+class ClientTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(os.path.join(self.dir.name, 'cache'),
+                               ttl=60)
+        self.server = Server()
+        self.api = paniot.IotApi(customerid='x', access_key_id='x',
+                                 access_key='x', http_cache=self.cache)
+
+        def request_retry(**kwargs):
+            status, reason, headers, body = self.server.response(kwargs)
+            resp = requests.Response()
+            resp.status_code = status
+            resp.reason = reason
+            resp.headers = requests.structures.CaseInsensitiveDict(headers)
+            resp._content = body
+            resp._content_consumed = True
+            return resp
+
+        self.api._request_retry = request_retry
+
+    def tearDown(self):
+        self.api.session.close()
+        self.dir.cleanup()
+
+    def test_01(self):
+        resp = self.api.policy()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, BODY)
+        resp = self.api.policy()
+        self.assertEqual(resp.json()['total'], 2)
+        self.assertEqual(resp.headers['etag'], '"1"')
+        self.assertEqual(len(self.server.calls), 1)
+        self.assertEqual(self.server.calls[0][1], {})
+
+        # expired: conditional request, 304 returns the cached body
+        self.cache.now += 60
+        resp = self.api.policy(stream=True)
+        self.assertEqual(self.server.calls[1][1], {'If-None-Match': '"1"'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.iter_content(4)), BODY)
+        self.api.policy()
+        self.assertEqual(len(self.server.calls), 2)
+
+        self.server.etag = '"2"'
+        self.cache.now += 60
+        self.assertEqual(self.api.policy().status_code, 200)
+        self.assertEqual(self.cache.get(self.api.url +
+                                        '/pub/v4.0/policy/recommendation',
+                                        {'customerid': 'x'}).headers['etag'],
+                         '"2"')
+
+    def test_02(self):
+        # pages are not cached
+        for _ in range(2):
+            self.assertEqual(len(list(self.api.policies_all())), 2)
+            self.api.policy(offset=0)
+        self.assertEqual(len(self.server.calls), 4)
+        self.assertEqual(os.listdir(self.cache.path), [])
+
+
+class AioClientTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(os.path.join(self.dir.name, 'cache'),
+                               ttl=60)
+        self.server = Server()
+        self.api = paniot.IotApi(customerid='x', access_key_id='x',
+                                 access_key='x', http_cache=self.cache)
+
+        async def request_retry(**kwargs):
+            return AioResponse(*self.server.response(kwargs))
+
+        self.api._request_retry = request_retry
+
+    async def asyncTearDown(self):
+        await self.api.session.close()
+        self.dir.cleanup()
+
+    async def test_01(self):
+        resp = await self.api.policy()
+        self.assertEqual(resp.status, 200)
+        self.assertEqual((await resp.json())['total'], 2)
+        resp = await self.api.policy()
+        self.assertEqual(await resp.read(), BODY)
+        self.assertEqual(resp.headers['content-length'], str(len(BODY)))
+        self.assertEqual(len(self.server.calls), 1)
+        self.assertEqual(self.server.calls[0][1], {})
+
+        # expired: conditional request, 304 returns the cached body
+        self.cache.now += 60
+        resp = await self.api.policy()
+        self.assertEqual(self.server.calls[1][1], {'If-None-Match': '"1"'})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(await resp.text(), BODY.decode())
+
+        # incremental parsing reads the cached body in chunks
+        parser = ArrayParser(['policies'])
+        items = []
+        async for chunk in resp.content.iter_chunked(4):
+            items.extend(parser.feed(chunk))
+        items.extend(parser.close())
+        self.assertEqual(items, [{'name': 'a'}, {'name': 'b'}])
+        self.assertEqual(parser.total, 2)
+
+        await self.api.policy()
+        self.assertEqual(len(self.server.calls), 2)
+
+    async def test_02(self):
+        # pages are not cached
+        for _ in range(2):
+            x = [item async for item in self.api.policies_all()]
+            self.assertEqual(len(x), 2)
+            await self.api.policy(offset=0)
+        self.assertEqual(len(self.server.calls), 4)
+        self.assertEqual(os.listdir(self.cache.path), [])
@@ -0,0 +1,58 @@
+import subprocess
+import sys
+import unittest
+
+# Import paniot, create a client, and print the backend modules loaded.
+CODE = '''
+import sys
+import paniot
+%s
+print(' '.join(sorted(x for x in ['asyncio', 'aiohttp', 'requests']
+                      if x in sys.modules)))
+'''
+
+NOAIO = '''
+api = paniot.IotApi(customerid='x', access_key_id='x', access_key='x')
+'''
+
+AIO = '''
+import asyncio
+
+async def main():
+    async with paniot.IotApi(customerid='x', access_key_id='x',
+                             access_key='x'):
+        pass
+
+asyncio.run(main())
+'''
+
+
+def run(code):
+    x = subprocess.run([sys.executable, '-c', CODE % code],
+                       capture_output=True, text=True, check=True)
+
+    return set(x.stdout.split())
+
+
+class ImportTest(unittest.TestCase):
+    def test_01(self):
+        modules = run('')
+        self.assertEqual(modules, set())
+
+    def test_02(self):
+        modules = run(NOAIO)
+        self.assertIn('requests', modules)
+        self.assertNotIn('aiohttp', modules)
+        self.assertNotIn('asyncio', modules)
+
+    def test_03(self):
+        modules = run(AIO)
+        self.assertIn('aiohttp', modules)
+        self.assertNotIn('requests', modules)
+
+    def test_04(self):
+        x = subprocess.run([sys.executable, '-c',
+                            'import paniot.mixin; '
+                            'print(paniot.mixin.Mixin.__module__)'],
+                           capture_output=True, text=True, check=True)
+        self.assertEqual(x.stdout.strip(), 'paniot.requestsmixin')
@@ -0,0 +1,150 @@
+from collections import namedtuple
+import unittest
+
+import paniot
+import paniot.inventory
+
+Response = namedtuple('Response', ['status', 'reason'])
+
+
+def device(i, **kwargs):
+    x = {
+        'deviceid': 'd%d' % i,
+        'ip_address': '10.0.0.%d' % i,
+        'mac_address': '00:00:00:00:00:%02x' % i,
+        'profile': 'Profile %d' % (i % 2),
+        'category': 'Category',
+        'vendor': 'Vendor',
+    }
+    x.update(kwargs)
+    return x
+
+
+class Api:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    async def devices_pages(self, **kwargs):
+        self.calls.append(kwargs)
+        for offset, x in enumerate(self.pages):
+            if isinstance(x, Response):
+                yield False, x
+            else:
+                yield True, paniot.Page(x, offset, None, 0.0)
+
+
+class SyncApi(Api):
+    def __init__(self, pages):
+        super().__init__(pages)
+        self.closed = False
+
+    def devices_pages(self, **kwargs):
+        self.calls.append(kwargs)
+        try:
+            for offset, x in enumerate(self.pages):
+                if isinstance(x, Response):
+                    yield False, x
+                else:
+                    yield True, paniot.Page(x, offset, None, 0.0)
+        finally:
+            self.closed = True
+
+
+class InventoryTest(unittest.IsolatedAsyncioTestCase):
+    def test_01(self):
+        inv = paniot.inventory.Inventory([device(i) for i in range(4)])
+        self.assertEqual(len(inv), 4)
+        self.assertIn('d1', inv)
+        self.assertEqual(inv.get('d1')['ip_address'], '10.0.0.1')
+        self.assertEqual(inv.find('ip', '10.0.0.2'), [device(2)])
+        self.assertEqual(inv.find('mac', '00:00:00:00:00:03'), [device(3)])
+        self.assertEqual(inv.find('deviceid', 'd0'), [device(0)])
+        self.assertEqual(inv.find('deviceid', 'x'), [])
+        self.assertEqual([x['deviceid'] for x in
+                          inv.find('profile', 'Profile 1')],
+                         ['d1', 'd3'])
+        self.assertEqual(len(inv.find('vendor', 'Vendor')), 4)
+
+        inv.add(device(1, ip_address='10.0.0.2', profile=None))
+        self.assertEqual(inv.find('ip', '10.0.0.1'), [])
+        self.assertEqual(len(inv.find('ip', '10.0.0.2')), 2)
+        self.assertEqual(len(inv.find('profile', 'Profile 1')), 1)
+        inv.remove('d3')
+        self.assertEqual(inv.find('profile', 'Profile 1'), [])
+        self.assertNotIn('Profile 1', inv.indexes['profile'])
+        self.assertEqual(len(inv), 3)
+
+        with self.assertRaises(paniot.ArgsError) as e:
+            inv.find('hostname', 'x')
+        self.assertEqual(str(e.exception), 'invalid index: "hostname"')
+        with self.assertRaises(paniot.ArgsError) as e:
+            inv.add({})
+        self.assertEqual(str(e.exception), 'device missing deviceid')
+
+    async def test_02(self):
+        inv = paniot.inventory.Inventory()
+        api = Api([[device(0), device(1)], [device(2)]])
+        self.assertEqual(await inv.aiorefresh(api), 3)
+        self.assertEqual(api.calls[0], {'stime': None, 'detail': True})
+        stime = inv.stime
+        self.assertIsNotNone(stime)
+
+        api = Api([[device(1, vendor='Other')]])
+        self.assertEqual(await inv.aiorefresh(api, detail=False), 1)
+        self.assertEqual(api.calls[0], {'stime': stime, 'detail': False})
+        self.assertEqual(len(inv), 3)
+        self.assertEqual(inv.find('vendor', 'Other'), [inv.get('d1')])
+
+        api = Api([[device(5)], Response(500, 'Internal Server Error')])
+        with self.assertRaises(paniot.ApiError) as e:
+            await inv.aiorefresh(api, full=True)
+        self.assertEqual(str(e.exception),
+                         'devices: 500 Internal Server Error')
+        self.assertEqual(len(inv), 3)
+        self.assertNotIn('d5', inv)
+
+        api = Api([[device(5)]])
+        self.assertEqual(await inv.aiorefresh(api, full=True), 1)
+        self.assertEqual(api.calls[0]['stime'], None)
+        self.assertEqual([x['deviceid'] for x in inv], ['d5'])
+        self.assertEqual(inv.find('ip', '10.0.0.1'), [])
+
+    def test_03(self):
+        inv = paniot.inventory.Inventory()
+        api = SyncApi([[device(0), device(1)], [device(2)]])
+        self.assertEqual(inv.refresh(api), 3)
+        self.assertEqual(api.calls[0], {'stime': None, 'detail': True})
+        self.assertTrue(api.closed)
+        stime = inv.stime
+        self.assertIsNotNone(stime)
+
+        api = SyncApi([[device(2, ip_address='10.0.0.9')]])
+        self.assertEqual(inv.refresh(api, detail=False), 1)
+        self.assertEqual(api.calls[0], {'stime': stime, 'detail': False})
+        self.assertEqual(len(inv), 3)
+        self.assertEqual(inv.find('ip', '10.0.0.9'), [inv.get('d2')])
+        self.assertEqual(inv.find('ip', '10.0.0.2'), [])
+
+        # a failed full refresh keeps the current devices and closes
+        # the generator
+        devices, indexes = inv.devices, inv.indexes
+        api = SyncApi([[device(5)], Response(503, 'Service Unavailable'),
+                       [device(6)]])
+        with self.assertRaises(paniot.ApiError) as e:
+            inv.refresh(api, full=True)
+        self.assertEqual(str(e.exception),
+                         'devices: 503 Service Unavailable')
+        self.assertTrue(api.closed)
+        self.assertIs(inv.devices, devices)
+        self.assertIs(inv.indexes, indexes)
+        self.assertNotIn('d5', inv)
+
+        api = SyncApi([[device(5)], [device(6)]])
+        self.assertEqual(inv.refresh(api, full=True), 2)
+        self.assertIsNone(api.calls[0]['stime'])
+        self.assertIsNot(inv.devices, devices)
+        self.assertEqual(sorted(x['deviceid'] for x in inv), ['d5', 'd6'])
+        self.assertEqual(inv.find('vendor', 'Vendor'),
+                         [inv.get('d5'), inv.get('d6')])
+        self.assertEqual(inv.find('ip', '10.0.0.9'), [])
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+IOTAPI = os.path.join(os.path.dirname(__file__), os.pardir, 'bin',
+                      'iotapi.py')
+
+
+def iotapi(*args):
+    return subprocess.run([sys.executable, IOTAPI] + list(args),
+                          capture_output=True, text=True)
+
+
+class IotapiTest(unittest.TestCase):
+    def test_01(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.json')
+            for args in [['--device', '--deviceid', 'x'],
+                         ['--device', '--ip', '10.0.0.1'],
+                         ['--profile']]:
+                x = iotapi(*args, '--panos', 'set', '--panos-state', path)
+                self.assertEqual(x.returncode, 1, args)
+                self.assertIn('--panos-state requires --devices or '
+                              '--panos-input', x.stderr)
+            self.assertFalse(os.path.exists(path))
+
+    def test_02(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.json')
+            devices = os.path.join(tmp, 'devices.json')
+            with open(devices, 'w') as f:
+                f.write('{"deviceid": "00:11:22:33:44:55", '
+                        '"ip_address": "10.0.0.1", "profile": "x"}\n')
+            x = iotapi('--panos-input', devices, '--panos', 'set',
+                       '--panos-state', path)
+            self.assertEqual(x.returncode, 0, x.stderr)
+            self.assertIn('set device-object', x.stdout)
+            self.assertTrue(os.path.exists(path))
@@ -0,0 +1,42 @@
+import unittest
+
+import paniot
+from paniot import jsoncodec
+
+
+class JsonCodecTest(unittest.TestCase):
+    def test_01(self):
+        x = jsoncodec.codec()
+        self.assertIn(x.name, jsoncodec.CODECS)
+        x = jsoncodec.codec('json')
+        self.assertEqual(x.name, 'json')
+
+        with self.assertRaises(paniot.ArgsError) as e:
+            jsoncodec.codec('simplejson')
+        self.assertEqual(str(e.exception), 'invalid json_codec: "simplejson"')
+
+    def test_02(self):
+        obj = {'b': [1, 2.5, None, True], 'a': 'x/y é'}
+        for name in jsoncodec.CODECS:
+            try:
+                x = jsoncodec.codec(name)
+            except paniot.ArgsError:
+                continue
+            s = x.dumps(obj, sort_keys=True)
+            self.assertIsInstance(s, str)
+            self.assertTrue(s.startswith('{"a":'), name)
+            self.assertNotIn(', ', s)
+            self.assertEqual(x.loads(s), obj)
+            self.assertEqual(x.loads(s.encode()), obj)
+
+    def test_03(self):
+        kwargs = {
+            'customerid': 'x',
+            'access_key_id': 'x',
+            'access_key': 'x',
+        }
+        with self.assertRaises(paniot.ArgsError):
+            paniot.IotApi(json_codec='simplejson', **kwargs)
+
+        with paniot.IotApi(json_codec='json', **kwargs) as api:
+            self.assertEqual(api.json_codec.name, 'json')
@@ -0,0 +1,95 @@
+import io
+import json
+import unittest
+
+import requests
+
+import paniot
+from paniot.jsonstream import ArrayParser
+
+
+def parse(keys, data, size):
+    parser = ArrayParser(keys)
+    items = []
+    for i in range(0, len(data), size):
+        items.extend(parser.feed(data[i:i + size]))
+    items.extend(parser.close())
+    return items, parser.total
+
+
+class ArrayParserTest(unittest.TestCase):
+    def test_01(self):
+        devices = [{'deviceid': 'd%d' % i, 'n': i, 'f': -1.5e-3 * i,
+                    'x': 'café "/\\\n', 'a': [None, True, {}]}
+                   for i in range(50)]
+        obj = {'total': 5500, 'devices': devices, 'after': {'k': [1]}}
+        for indent in [None, 2]:
+            data = json.dumps(obj, indent=indent,
+                              ensure_ascii=False).encode()
+            for size in [1, 7, 4096]:
+                items, total = parse(['devices'], data, size)
+                self.assertEqual(items, devices)
+                self.assertEqual(total, 5500)
+
+    def test_02(self):
+        items = [{'vulnerability_name': 'x', 'n': 12.5e3}, 3, 'y']
+        obj = {'items': {'count': 1, 'items': items}, 'total': 7}
+        data = json.dumps(obj).encode()
+        for size in [1, 3, 100]:
+            x, total = parse(['items', 'items'], data, size)
+            self.assertEqual(x, items)
+            self.assertEqual(total, 7)
+
+        x, _ = parse(['devices'], b'{"devices": []}', 1)
+        self.assertEqual(x, [])
+
+    def test_03(self):
+        for data in [b'{"x": 1}', b'{}']:
+            with self.assertRaises(KeyError):
+                parse(['devices'], data, 2)
+
+        for data in [b'{"devices": [1, 2', b'{"devices": [1 2]}',
+                     b'[1]', b'{"devices": [1.]}']:
+            with self.assertRaises(ValueError):
+                parse(['devices'], data, 2)
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.api = paniot.IotApi(customerid='x', access_key_id='x',
+                                 access_key='x')
+        self.calls = []
+        devices = [{'deviceid': 'd%d' % i} for i in range(1500)]
+
+        def get(**kwargs):
+            self.calls.append(kwargs)
+            offset = kwargs['params'].get('offset', 0)
+            pagelength = kwargs['params'].get('pagelength', 1000)
+            obj = {'devices': devices[offset:offset + pagelength]}
+            resp = requests.Response()
+            resp.status_code = 200
+            resp.raw = io.BytesIO(json.dumps(obj).encode())
+            return resp
+
+        self.api.session.get = get
+
+    def tearDown(self):
+        self.api.session.close()
+
+    def test_01(self):
+        items = []
+        for ok, x in self.api.devices_all(incremental=True):
+            self.assertTrue(ok)
+            items.append(x)
+            if len(items) == 1:
+                # other requests during the get all are not streamed
+                self.api.device(pagelength=1)
+        self.assertEqual(len(items), 1500)
+        self.assertEqual([x.get('stream') for x in self.calls],
+                         [True, None, True])
+
+        self.calls.clear()
+        x = list(self.api.devices_all())
+        self.assertEqual(len(x), 1500)
+        self.assertEqual([x.get('stream') for x in self.calls],
+                         [None, None])
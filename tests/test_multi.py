@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import unittest
+
+import paniot
+import paniot.multi
+
+
+class MultiTest(unittest.IsolatedAsyncioTestCase):
+    def test_01(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'keys.json')
+            with open(path, 'w') as f:
+                json.dump({
+                    'customerid': 'x',
+                    'access-key-id': 'id',
+                    'access-key': 'key',
+                    'timeout': 5,
+                }, f)
+            x = paniot.multi.tenant_config(path)
+            self.assertEqual(x, {
+                'customerid': 'x',
+                'access_key_id': 'id',
+                'access_key': 'key',
+            })
+
+            with self.assertRaises(paniot.ArgsError):
+                paniot.multi.tenant_config(os.path.join(d, 'missing.json'))
+
+    async def test_02(self):
+        with self.assertRaises(paniot.ArgsError) as e:
+            async for x in paniot.multi.tenants_all([], method='devices'):
+                pass
+        self.assertEqual(str(e.exception), 'invalid method: "devices"')
+
+        with self.assertRaises(paniot.ArgsError) as e:
+            async for x in paniot.multi.tenants_all([]):
+                pass
+        self.assertEqual(str(e.exception), 'no tenants')
+
+    async def test_03(self):
+        tenants = [{'customerid': 'x'}]
+        with self.assertRaises(paniot.ArgsError) as e:
+            async for x in paniot.multi.tenants_all(tenants):
+                pass
+        self.assertEqual(str(e.exception), 'access_key_id required')
+
+    async def test_04(self):
+        tenants = [{'customerid': 'x'}]
+        with self.assertRaises(paniot.ArgsError) as e:
+            async for x in paniot.multi.tenants_all(
+                    tenants, method='vulnerabilities_all', concurrency=2):
+                pass
+        self.assertEqual(str(e.exception),
+                         'vulnerabilities_all: invalid argument: '
+                         '"concurrency"')
+
+        with self.assertRaises(paniot.ArgsError) as e:
+            async for x in paniot.multi.tenants_all(
+                    tenants, api_kwargs={'rate_limiter': None}):
+                pass
+        self.assertEqual(str(e.exception),
+                         'api_kwargs: rate_limiter not allowed')
+
+    async def test_05(self):
+        calls = []
+
+        class IotApi:
+            def __init__(self, **kwargs):
+                calls.append(kwargs)
+                self.customerid = kwargs['customerid']
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                pass
+
+            async def alerts_all(self, **kwargs):
+                yield True, kwargs
+
+        tenants = [{'customerid': 'x', 'verify': False},
+                   {'customerid': 'y'}]
+        api_kwargs = {'timeout': 5, 'verify': True, 'json_codec': 'json'}
+        saved = paniot.multi.IotApi
+        paniot.multi.IotApi = IotApi
+        try:
+            items = []
+            async for x in paniot.multi.tenants_all(
+                    tenants, method='alerts_all', stime='x',
+                    api_kwargs=api_kwargs):
+                items.append(x)
+            self.assertEqual(sorted(x[0] for x in items), ['x', 'y'])
+            self.assertEqual(items[0][2], {'stime': 'x'})
+            calls.sort(key=lambda x: x['customerid'])
+            self.assertEqual(calls[0]['timeout'], 5)
+            self.assertEqual(calls[0]['verify'], False)
+            self.assertEqual(calls[1]['verify'], True)
+            self.assertEqual(calls[1]['json_codec'], 'json')
+            self.assertIsInstance(calls[0]['rate_limiter'],
+                                  paniot.ratelimit.RateLimiter)
+            self.assertIs(calls[0]['rate_limiter'], calls[1]['rate_limiter'])
+
+            for x in [None, False]:
+                calls.clear()
+                async for _ in paniot.multi.tenants_all(
+                        tenants, method='alerts_all', rate_limiter=x):
+                    pass
+                self.assertEqual(len(calls), 2)
+                for kwargs in calls:
+                    self.assertIsNone(kwargs['rate_limiter'])
+        finally:
+            paniot.multi.IotApi = saved
@@ -78,3 +78,27 @@ class IotApiTest(unittest.TestCase):
                   self.api.alert_update]:
             self.assertTrue(x.window > 0)
             self.assertTrue(x.rate_limit > 0)
+
+    def test_07(self):
+        kwargs = {
+            'customerid': 'x',
+            'access_key_id': 'x',
+            'access_key': 'x',
+            'keepalive_timeout': -1,
+        }
+        with self.assertRaises(paniot.ArgsError) as e:
+            self.api = paniot.IotApi(**kwargs)
+        self.assertEqual(str(e.exception),
+                         'keepalive_timeout must be >= 0')
+
+    def test_08(self):
+        kwargs = {
+            'customerid': 'x',
+            'access_key_id': 'x',
+            'access_key': 'x',
+            'pool_size': 50,
+            'tcp_nodelay': True,
+        }
+        self.api = paniot.IotApi(**kwargs)
+        adapter = self.api.session.get_adapter(self.api.url)
+        self.assertEqual(adapter._pool_maxsize, 50)
@@ -82,3 +82,35 @@ class IotApiTest(mixin.Mixin, unittest.TestCase):
             total += 1
             if total > 1050:
                 break
+
+    def test_10(self):
+        serial = []
+        for ok, x in self.api.devices_all():
+            self.assertTrue(ok)
+            serial.append(x['deviceid'])
+            if len(serial) > 2050:
+                break
+        concurrent = []
+        for ok, x in self.api.devices_all(concurrency=4):
+            self.assertTrue(ok)
+            concurrent.append(x['deviceid'])
+            if len(concurrent) > 2050:
+                break
+        self.assertEqual(serial, concurrent)
+
+    def test_11(self):
+        items = []
+        for ok, x in self.api.devices_all():
+            self.assertTrue(ok)
+            items.append(x['deviceid'])
+            if len(items) >= 2000:
+                break
+        pages = []
+        for ok, x in self.api.devices_pages():
+            self.assertTrue(ok)
+            self.assertIsInstance(x, paniot.Page)
+            self.assertEqual(x.offset, len(pages))
+            pages.extend(y['deviceid'] for y in x.items)
+            if len(pages) >= 2000:
+                break
+        self.assertEqual(items, pages[:len(items)])
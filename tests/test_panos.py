@@ -0,0 +1,335 @@
+import asyncio
+from hashlib import blake2b
+import io
+import itertools
+import os
+import random
+import time
+import unittest
+from xml.dom import minidom
+import xml.etree.ElementTree as etree
+
+import paniot
+
+# PANIOT_BENCHMARK=1 to run the benchmarks up to 1M devices and check
+# the timings
+BENCHMARK = bool(os.getenv('PANIOT_BENCHMARK'))
+
+
+def devices(n, profiles=1000, seed=0):
+    r = random.Random(seed)
+    x = []
+    for i in range(n):
+        p = r.randrange(profiles)
+        x.append({
+            'deviceid': 'dev-%d' % i,
+            'profile': 'Profile %d' % p,
+            'category': 'Category %d' % (p % 50),
+            'vendor': 'Vendor %d & Co' % (p % 20),
+            'model': 'Model %d' % (p % 100),
+            'confidence_score': 90,
+        })
+
+    return x
+
+
+def normalize_replace(x):
+    # previous implementation
+    for s in [' & ', ' &', '& ', '&']:
+        x = x.replace(s, ' and ')
+    return x
+
+
+def name_blake2b(x):
+    # previous implementation
+    data = str(sorted(x.items()))
+    h = blake2b(data.encode(),
+                digest_size=15)
+    return h.hexdigest()
+
+
+def dedup_quadratic(objects):
+    # previous implementation
+    new = []
+    for i in range(len(objects)):
+        if objects[i] not in objects[i + 1:]:
+            new.append(objects[i])
+
+    return new
+
+
+class PanosTest(unittest.TestCase):
+    def test_01(self):
+        data = devices(3000, profiles=200)
+        for x in data:
+            del x['deviceid']
+
+        def parse(objects):
+            # set device-object name key "value"
+            x = []
+            for obj in objects:
+                d = {}
+                for line in obj.split('\n'):
+                    _, _, _, key, value = line.split(' ', 4)
+                    d[key] = value
+                x.append(d)
+            return x
+
+        x = parse(paniot.panos_device_objects(data=data, format='set'))
+        y = parse(paniot.panos_device_objects(data=data, format='set',
+                                              dedup=False))
+        self.assertEqual(len(y), len(data))
+        self.assertLessEqual(len(x), 200)
+        # same objects and order as the previous implementation
+        self.assertEqual(x, dedup_quadratic(y))
+
+    def test_02(self):
+        data = [
+            {'profile': 'a', 'vendor': 'v'},
+            {'profile': 'b'},
+            {'vendor': 'v', 'profile': 'a'},
+        ]
+        x = paniot.panos_device_objects(data=data, format='set')
+        self.assertEqual(len(x), 2)
+        # last occurrence is kept
+        self.assertIn('"b"', x[0])
+        self.assertIn('"a"', x[1])
+
+    def test_03(self):
+        sizes = [10000, 40000]
+        if BENCHMARK:
+            sizes = [10000, 100000, 1000000]
+
+        elapsed = []
+        for n in sizes:
+            data = devices(n, profiles=n // 10)
+            start = time.perf_counter()
+            x = paniot.panos_device_objects(data=data, format='set')
+            elapsed.append(time.perf_counter() - start)
+            self.assertTrue(x)
+            if BENCHMARK:
+                print('\n%8d devices %.3fs %.2fus/device' % (
+                    n, elapsed[-1], elapsed[-1] / n * 1e6), end='')
+
+        if BENCHMARK:
+            # linear: time per device does not grow with n (allowing
+            # for noise)
+            per_device = [t / n for t, n in zip(elapsed, sizes)]
+            self.assertLess(per_device[-1], per_device[0] * 4)
+
+    def test_04(self):
+        data = devices(3000, profiles=200)
+        for format in ['set', 'xml', 'xml3']:
+            x = paniot.panos_device_objects(data=data, format=format)
+            y = list(paniot.panos_device_objects_iter(data=iter(data),
+                                                      format=format))
+            if format == 'set':
+                self.assertEqual(sorted(x), sorted(y))
+                continue
+            x = list(x[0])
+            self.assertEqual(len(x), len(y))
+            if format == 'xml3':
+                # ids are assigned in output order
+                self.assertEqual([z.get('id') for z in y],
+                                 [str(i) for i in range(1, len(y) + 1)])
+                x = [z[0] for z in x]
+                y = [z[0] for z in y]
+            self.assertEqual(sorted(z.get('name') for z in x),
+                             sorted(z.get('name') for z in y))
+            self.assertEqual(sorted(etree.tostring(z) for z in x),
+                             sorted(etree.tostring(z) for z in y))
+
+    def test_05(self):
+        data = [(True, x) for x in devices(100, profiles=10)]
+        x = list(paniot.panos_device_objects_iter(data=data, format='set'))
+        self.assertEqual(len(x), 10)
+
+        data.append((False, None))
+        with self.assertRaises(paniot.ApiError):
+            list(paniot.panos_device_objects_iter(data=data, format='set'))
+
+        with self.assertRaises(paniot.ArgsError):
+            paniot.panos_device_objects_iter(data=data, format='json')
+
+    def test_06(self):
+        async def data():
+            for x in devices(100, profiles=10):
+                yield True, x
+
+        async def main():
+            return [x async for x in paniot.panos_device_objects_aiter(
+                data=data(), format='set')]
+
+        x = asyncio.run(main())
+        self.assertEqual(
+            x,
+            list(paniot.panos_device_objects_iter(
+                data=devices(100, profiles=10), format='set')))
+
+    def test_07(self):
+        def toprettyxml(element):
+            # previous iotapi.py XML output
+            document = etree.tostring(element, encoding='UTF-8')
+            dom = minidom.parseString(document.decode('UTF-8'))
+            document = dom.toprettyxml(indent=' ' * 2)
+            return document[document.find('\n') + 1:]
+
+        data = devices(200, profiles=20)
+        data[0]['vendor'] = 'A&B <"x"> \'y\''
+        data[1]['vertical'] = ''
+        data[2]['model'] = 'caf\u00e9\tmodel\r\nline'
+        data[3]['vertical'] = ' spaced  '
+        for format in ['xml', 'xml2', 'xml3']:
+            root = paniot.panos_device_objects(data=data, format=format,
+                                               dedup=False)[0]
+            x = io.StringIO()
+            paniot.panos_xml_write(root, x)
+            self.assertEqual(x.getvalue(), toprettyxml(root))
+
+        root = etree.Element('a', {'k': 'x\ny"'})
+        etree.SubElement(root, 'b')
+        etree.SubElement(root, 'c').text = ''
+        root[1].tail = 'tail'
+        etree.SubElement(root, 'd').text = ' <&> '
+        x = io.StringIO()
+        paniot.panos_xml_write(root, x)
+        self.assertEqual(x.getvalue(), toprettyxml(root))
+
+        x = io.StringIO()
+        paniot.panos_xml_write(root[0], x, level=2)
+        self.assertEqual(x.getvalue(), '    <b/>\n')
+
+    def test_08(self):
+        data = devices(3000, profiles=250)
+        x = paniot.panos_device_objects(data=data, format='xml2')
+        self.assertEqual(len(x), 1)
+        total = len(x[0])
+
+        chunks = paniot.panos_device_objects(data=data, format='xml2',
+                                             chunk_size=100)
+        self.assertEqual(len(chunks), (total + 99) // 100)
+        for chunk in chunks:
+            self.assertEqual(chunk.tag, 'multi-config')
+            self.assertLessEqual(len(chunk), 100)
+            self.assertEqual([z.get('id') for z in chunk],
+                             [str(i) for i in range(1, len(chunk) + 1)])
+        self.assertEqual([z[0].get('name') for z in x[0]],
+                         [z[0].get('name') for c in chunks for z in c])
+
+        y = list(paniot.panos_device_objects_iter(data=data, format='xml3',
+                                                  chunk_size=100))
+        self.assertEqual([len(z) for z in y], [len(z) for z in chunks])
+
+        for format in ['set', 'xml']:
+            with self.assertRaises(paniot.ArgsError):
+                paniot.panos_device_objects(data=data, format=format,
+                                            chunk_size=100)
+        with self.assertRaises(paniot.ArgsError):
+            paniot.panos_device_objects(data=data, format='xml2',
+                                        chunk_size=0)
+
+    def test_09(self):
+        data = devices(1000, profiles=100)
+        commands, names = paniot.panos_device_objects_diff(data=data)
+        self.assertEqual(sorted(commands),
+                         sorted(paniot.panos_device_objects(data=data,
+                                                            format='set')))
+        self.assertEqual(len(names), len(commands))
+
+        x, y = paniot.panos_device_objects_diff(data=data, names=names)
+        self.assertEqual(x, [])
+        self.assertEqual(y, names)
+
+        data = [
+            {'profile': 'a', 'vendor': 'v'},
+            {'profile': 'b', 'vendor': 'v'},
+        ]
+        _, names = paniot.panos_device_objects_diff(data=data)
+        data[1]['profile'] = 'c'
+        x, y = paniot.panos_device_objects_diff(
+            data=[(True, z) for z in data], names=names)
+        self.assertEqual(len(x), 2)
+        self.assertTrue(x[0].startswith('delete device-object '))
+        self.assertIn(x[0].split()[-1], names - y)
+        self.assertIn('profile "c"', x[1])
+        self.assertEqual(len(y), 2)
+
+    def test_10(self):
+        for n in range(1, 8):
+            for x in itertools.product('a &', repeat=n):
+                x = ''.join(x)
+                self.assertEqual(paniot._normalize(x), normalize_replace(x),
+                                 repr(x))
+
+        data = devices(1000, profiles=50)
+        for x in data:
+            del x['deviceid']
+            del x['confidence_score']
+            self.assertEqual(paniot._DeviceObjects.name(x), name_blake2b(x))
+
+        paniot.panos_cache_clear()
+        paniot.panos_device_objects(data=data, format='set')
+        x = paniot.panos_cache_info()
+        self.assertGreater(x['normalize'].hits, 0.9 * 4 * len(data))
+        self.assertLessEqual(x['normalize'].currsize,
+                             paniot.PANOS_CACHE_SIZE)
+        self.assertLessEqual(x['name'].misses, 50)
+
+    def test_11(self):
+        # micro-benchmark: memoized normalize() and name() on
+        # repeating values
+        n = 1000000 if BENCHMARK else 50000
+        data = devices(n, profiles=2000)
+        fields = ['category', 'profile', 'model', 'vendor']
+        values = [x[k] for x in data for k in fields]
+        objects = [{k: x[k] for k in fields} for x in data]
+
+        def timeit(func, items):
+            start = time.perf_counter()
+            for x in items:
+                func(x)
+            return time.perf_counter() - start
+
+        paniot.panos_cache_clear()
+        elapsed = [
+            timeit(normalize_replace, values),
+            timeit(paniot._DeviceObjects.normalize, values),
+            timeit(name_blake2b, objects),
+            timeit(paniot._DeviceObjects.name, objects),
+        ]
+        x = paniot.panos_cache_info()
+        self.assertGreater(x['normalize'].hits, 0.9 * len(values))
+        self.assertGreater(x['name'].hits, 0.9 * len(objects))
+        for k in x:
+            self.assertLessEqual(x[k].currsize, paniot.PANOS_CACHE_SIZE)
+
+        if BENCHMARK:
+            print('\nnormalize %.3fs -> %.3fs, name %.3fs -> %.3fs' %
+                  tuple(elapsed), end='')
+            for k in x:
+                print('\n%s hit rate %.1f%%' % (
+                    k, 100 * x[k].hits / (x[k].hits + x[k].misses)),
+                    end='')
+
+            # allow for noise; typically about 2x faster
+            self.assertLess(elapsed[1], elapsed[0] * 1.5)
+            self.assertLess(elapsed[3], elapsed[2] * 1.5)
+
+    def test_12(self):
+        data = devices(2000, profiles=300)
+        data[10]['vertical'] = 'Medical'
+        for format in ['set', 'xml', 'xml2']:
+            for dedup in [True, False]:
+                x = paniot.panos_device_objects(data=data, format=format,
+                                                dedup=dedup)
+                y = paniot.panos_device_objects_parallel(
+                    data=iter(data), format=format, dedup=dedup,
+                    processes=2, shard_size=150)
+                if format != 'set':
+                    x = [etree.tostring(z) for z in x]
+                    y = [etree.tostring(z) for z in y]
+                self.assertEqual(x, y)
+
+        with self.assertRaises(paniot.ArgsError):
+            paniot.panos_device_objects_parallel(data=data, format='set',
+                                                 processes=0)
@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+import paniot
+import paniot.ratelimit
+
+
+class RateLimiter(paniot.ratelimit.RateLimiter):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.now = 0.0
+
+    def _time(self):
+        return self.now
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_01(self):
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.ratelimit.RateLimiter(burst=0)
+        self.assertEqual(str(e.exception), 'burst must be an integer > 0')
+
+    def test_02(self):
+        x = RateLimiter()
+        self.assertEqual(x.reserve('k', 60, 60), 0)
+        # refill is (rate_limit - burst) / window
+        self.assertAlmostEqual(x.reserve('k', 60, 60), 60 / 59)
+        self.assertAlmostEqual(x.reserve('k', 60, 60), 2 * 60 / 59)
+        # separate key has a separate bucket
+        self.assertEqual(x.reserve('j', 60, 60), 0)
+
+    def test_03(self):
+        x = RateLimiter(burst=10)
+        for _ in range(10):
+            self.assertEqual(x.reserve('k', 60, 180), 0)
+        self.assertAlmostEqual(x.reserve('k', 60, 180), 60 / 170)
+        x.now += 60
+        for _ in range(10):
+            self.assertEqual(x.reserve('k', 60, 180), 0)
+
+    def test_04(self):
+        # no more than rate_limit requests in any window
+        x = RateLimiter(burst=5)
+        t = []
+        for _ in range(200):
+            t.append(x.now + x.reserve('k', 60, 60))
+        t.sort()
+        for i in range(len(t) - 60):
+            self.assertGreaterEqual(t[i + 60] - t[i], 60)
+
+
+class IotApiTest(unittest.TestCase):
+    kwargs = {
+        'customerid': 'x',
+        'access_key_id': 'x',
+        'access_key': 'x',
+    }
+
+    def test_01(self):
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.IotApi(rate_limiter=True, **self.kwargs)
+        self.assertEqual(str(e.exception), 'rate_limiter not RateLimiter')
+
+    def test_02(self):
+        x = paniot.ratelimit.RateLimiter()
+        with paniot.IotApi(rate_limiter=x, **self.kwargs) as api:
+            self.assertIs(api.rate_limiter, x)
+            self.assertEqual(api._rate_limit_delay(api.device), 0)
+            self.assertGreater(api._rate_limit_delay(api.device), 0)
+            self.assertEqual(api._rate_limit_delay(api.device_details), 0)
+
+    def test_03(self):
+        async def aiotest():
+            x = paniot.ratelimit.RateLimiter()
+            async with paniot.IotApi(rate_limiter=x, **self.kwargs) as api:
+                self.assertIs(api.rate_limiter, x)
+                self.assertEqual(api._rate_limit_delay(api.alert), 0)
+                self.assertGreater(api._rate_limit_delay(api.alert), 0)
+
+        asyncio.run(aiotest())
+
+
+class FileRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_01(self):
+        # two limiters on the same file share the buckets
+        x = paniot.ratelimit.FileRateLimiter(self.path)
+        y = paniot.ratelimit.FileRateLimiter(self.path)
+        self.assertEqual(x.reserve(['acme', 'device'], 60, 60), 0)
+        self.assertGreater(y.reserve(['acme', 'device'], 60, 60), 0)
+        self.assertEqual(y.reserve(['acme', 'alert'], 60, 180), 0)
+
+    def test_02(self):
+        with open(self.path, 'w') as f:
+            f.write('x')
+        x = paniot.ratelimit.FileRateLimiter(self.path)
+        self.assertEqual(x.reserve('k', 60, 60), 0)
+
+    def test_03(self):
+        with self.assertRaises(paniot.ArgsError):
+            paniot.ratelimit.FileRateLimiter(
+                os.path.join(self.path, 'x'))
+
+    def test_04(self):
+        with multiprocessing.Pool(4) as pool:
+            x = pool.map(_file_reserve, [self.path] * 20)
+        self.assertEqual(len([d for d in x if d == 0]), 1)
+        self.assertEqual(len(set(round(d, 6) for d in x)), 20)
+
+
+def _file_reserve(path):
+    x = paniot.ratelimit.FileRateLimiter(path)
+    return x.reserve('k', 60, 60)
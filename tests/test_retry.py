@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+import email.utils
+import unittest
+
+import paniot
+import paniot.mixin
+
+
+def method():
+    pass
+
+
+method.window = 60
+method.rate_limit = 60
+
+
+class RetryTest(unittest.TestCase):
+    def test_01(self):
+        x = paniot.mixin._retry_after({})
+        self.assertIsNone(x)
+        x = paniot.mixin._retry_after({'retry-after': '3'})
+        self.assertEqual(x, 3)
+        x = paniot.mixin._retry_after({'ratelimit-reset': '2.5'})
+        self.assertEqual(x, 2.5)
+        x = paniot.mixin._retry_after({'retry-after': 'x'})
+        self.assertIsNone(x)
+
+    def test_02(self):
+        d = datetime.now(tz=timezone.utc) + timedelta(seconds=30)
+        x = {'retry-after': email.utils.format_datetime(d, usegmt=True)}
+        x = paniot.mixin._retry_after(x)
+        self.assertTrue(28 < x <= 30)
+        d = datetime.now(tz=timezone.utc) - timedelta(seconds=30)
+        x = {'retry-after': email.utils.format_datetime(d, usegmt=True)}
+        self.assertEqual(paniot.mixin._retry_after(x), 0)
+
+    def test_03(self):
+        x = paniot.mixin._Retry(method)
+        for i in range(10):
+            delay = x.delay()
+            self.assertTrue(0 <= delay <= min(15, 2 ** i))
+        x = paniot.mixin._Retry(method)
+        delay = x.delay(headers={'retry-after': '10'})
+        self.assertTrue(10 <= delay <= 11)
+
+    def test_04(self):
+        x = paniot.mixin._Retry(method)
+        for _ in range(paniot.mixin.TRANSIENT_RETRIES):
+            self.assertIsNotNone(x.delay(transient=True))
+        self.assertIsNone(x.delay(transient=True))
+        self.assertIsNotNone(x.delay())
+
+    def test_05(self):
+        x = paniot.mixin._Retry(method, max_retries=2)
+        self.assertIsNotNone(x.delay())
+        self.assertIsNotNone(x.delay(transient=True))
+        self.assertIsNone(x.delay())
+
+    def test_06(self):
+        x = paniot.mixin._Retry(method, deadline=5)
+        self.assertIsNone(x.delay(headers={'retry-after': '10'}))
+
+
+class IotApiTest(unittest.TestCase):
+    kwargs = {
+        'customerid': 'x',
+        'access_key_id': 'x',
+        'access_key': 'x',
+    }
+
+    def test_01(self):
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.IotApi(max_retries=-1, **self.kwargs)
+        self.assertEqual(str(e.exception), 'max_retries must be >= 0')
+
+    def test_02(self):
+        with self.assertRaises(paniot.ArgsError) as e:
+            paniot.IotApi(retry_deadline=0, **self.kwargs)
+        self.assertEqual(str(e.exception), 'retry_deadline must be > 0')
@@ -0,0 +1,134 @@
+from collections import namedtuple
+import os
+import tempfile
+import unittest
+
+import paniot
+import paniot.store
+
+Response = namedtuple('Response', ['status_code', 'reason'])
+
+
+class Api:
+    def __init__(self, data):
+        self.data = data
+        self.calls = []
+
+    def _pages(self, name, kwargs):
+        self.calls.append((name, kwargs))
+        x = self.data[name]
+        if isinstance(x, Response):
+            yield False, x
+            return
+        yield True, paniot.Page(x, 0, len(x), 0.0)
+
+    def devices_pages(self, **kwargs):
+        yield from self._pages('devices', kwargs)
+
+    def alerts_pages(self, **kwargs):
+        yield from self._pages('alerts', kwargs)
+
+    def vulnerabilities_pages(self, **kwargs):
+        yield from self._pages('vulnerabilities', kwargs)
+
+
+class AioApi(Api):
+    async def devices_pages(self, **kwargs):
+        for x in self._pages('devices', kwargs):
+            yield x
+
+    async def alerts_pages(self, **kwargs):
+        for x in self._pages('alerts', kwargs):
+            yield x
+
+    async def vulnerabilities_pages(self, **kwargs):
+        for x in self._pages('vulnerabilities', kwargs):
+            yield x
+
+
+def data(n):
+    return {
+        'devices': [{'deviceid': 'd%d' % i, 'n': n} for i in range(3)],
+        'alerts': [{'id': 'a%d' % n}],
+        'vulnerabilities': [{'deviceid': 'd0',
+                             'vulnerability_name': 'v%d' % i}
+                            for i in range(n)],
+    }
+
+
+class StoreTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'store.db')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_01(self):
+        with paniot.store.Store(self.path) as store:
+            api = Api(data(1))
+            x = store.sync(api)
+            self.assertEqual(x, {'devices': 3, 'alerts': 1,
+                                 'vulnerabilities': 1})
+            self.assertEqual(api.calls[0],
+                             ('devices', {'stime': None, 'detail': True}))
+            self.assertEqual(api.calls[2][1]['groupby'], 'device')
+            stime = store.stime('devices')
+            self.assertRegex(stime, r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ$')
+
+        with paniot.store.Store(self.path) as store:
+            api = Api(data(2))
+            store.sync(api, tables=['devices', 'vulnerabilities'],
+                       detail=False)
+            self.assertEqual(api.calls[0],
+                             ('devices', {'stime': stime, 'detail': False}))
+            self.assertEqual(store.get('devices', 'd1'),
+                             {'deviceid': 'd1', 'n': 2})
+            self.assertIsNone(store.get('devices', 'x'))
+            self.assertEqual(len(list(store.items('devices'))), 3)
+            self.assertEqual(list(store.items('alerts')), [{'id': 'a1'}])
+            self.assertEqual(
+                sorted(x['vulnerability_name']
+                       for x in store.items('vulnerabilities')),
+                ['v0', 'v1'])
+            self.assertEqual(store.get('vulnerabilities', 'd0', 'v1'),
+                             {'deviceid': 'd0', 'vulnerability_name': 'v1'})
+
+    def test_02(self):
+        with paniot.store.Store(self.path) as store:
+            with self.assertRaises(paniot.ArgsError) as e:
+                store.sync(Api(data(1)), tables=['policies'])
+            self.assertEqual(str(e.exception), 'invalid table: "policies"')
+
+            with self.assertRaises(paniot.ArgsError) as e:
+                store.get('vulnerabilities', 'd0')
+            self.assertEqual(str(e.exception),
+                             'vulnerabilities key is deviceid, '
+                             'vulnerability_name')
+
+            x = data(1)
+            x['devices'] = Response(401, 'Unauthorized')
+            with self.assertRaises(paniot.ApiError) as e:
+                store.sync(Api(x))
+            self.assertEqual(str(e.exception), 'devices: 401 Unauthorized')
+            self.assertIsNone(store.stime('devices'))
+
+            x = data(1)
+            x['alerts'].append({'deviceid': 'x'})
+            with self.assertRaises(paniot.ApiError) as e:
+                store.sync(Api(x))
+            self.assertEqual(str(e.exception),
+                             "alerts: item missing key 'id'")
+            # devices is committed, alerts is rolled back
+            self.assertIsNotNone(store.stime('devices'))
+            self.assertIsNone(store.stime('alerts'))
+            self.assertEqual(list(store.items('alerts')), [])
+
+    async def test_03(self):
+        with paniot.store.Store(self.path) as store:
+            api = AioApi(data(2))
+            x = await store.aiosync(api)
+            self.assertEqual(x, {'devices': 3, 'alerts': 1,
+                                 'vulnerabilities': 2})
+            self.assertEqual(store.get('alerts', 'a2'), {'id': 'a2'})
+            self.assertIsNotNone(store.stime('vulnerabilities'))